@@ -0,0 +1,124 @@
+"""
+Per cell aggregates (centers, areas, cell x barcode counts),
+cached next to the merfish binary
+"""
+import sys
+import numpy as np
+from os import path
+from scipy import sparse
+from reader import cache_key, iter_chunks
+from utils import grow
+
+
+_CACHE_VERSION = 1
+
+
+class CellAggregate:
+    """
+    Aggregates of all (non-empty) cells:
+
+    - `cell_ids`: the cellIDs (sorted)
+    - `counts`: number of points per cell
+    - `centers`: mean `abs_position` per cell
+    - `areas`: summed `area` per cell
+    - `barcode_counts`: sparse `(#cells, #barcodes)` matrix
+    """
+    cell_ids: np.ndarray
+    counts: np.ndarray
+    centers: np.ndarray
+    areas: np.ndarray
+    barcode_counts: sparse.csr_matrix
+
+    def __len__(self) -> int:
+        return len(self.cell_ids)
+
+    def barcode_freq(self) -> sparse.csr_matrix:
+        """Relative barcode frequencies per cell"""
+        return sparse.diags(1.0 / self.counts) @ self.barcode_counts
+
+    def save(self, fname: str, key: np.ndarray):
+        b = self.barcode_counts
+        with open(fname, 'wb') as io:
+            np.savez(io, key=key, cell_ids=self.cell_ids, counts=self.counts,
+                     centers=self.centers, areas=self.areas,
+                     data=b.data, indices=b.indices, indptr=b.indptr,
+                     shape=np.array(b.shape))
+
+    @staticmethod
+    def load(fname: str, key: np.ndarray = None) -> 'CellAggregate':
+        """Load from `fname`; `None` if the stored `key` differs"""
+        with np.load(fname) as z:
+            if key is not None and not np.array_equal(z['key'], key):
+                return None
+            agg = CellAggregate()
+            agg.cell_ids = z['cell_ids']
+            agg.counts = z['counts']
+            agg.centers = z['centers']
+            agg.areas = z['areas']
+            agg.barcode_counts = sparse.csr_matrix(
+                (z['data'], z['indices'], z['indptr']),
+                shape=tuple(z['shape']))
+        return agg
+
+
+def compute_aggregate(fname: str, chunk_records: int = 1 << 22) -> \
+        CellAggregate:
+    """Compute the aggregates in one pass over the chunks of `fname`"""
+    fields = ['cellID', 'barcode_id', 'abs_position', 'area']
+    counts = np.zeros(0, dtype=np.int64)
+    pos = np.zeros((0, 2))
+    areas = np.zeros(0)
+    keys, key_counts = [], []
+    n_barcodes = 0
+    for chunk in iter_chunks(fname, fields, chunk_records=chunk_records):
+        cell = chunk['cellID'].astype(np.int64)
+        n = max(len(counts), int(cell.max()) + 1)
+        counts = grow(counts, n) + np.bincount(cell, minlength=n)
+        pos = grow(pos, n)
+        for k in range(2):
+            pos[:, k] += np.bincount(cell, weights=chunk['abs_position'][:, k],
+                                     minlength=n)
+        areas = grow(areas, n) + np.bincount(cell, weights=chunk['area'],
+                                             minlength=n)
+        n_barcodes = max(n_barcodes, int(chunk['barcode_id'].max()) + 1)
+        # combined key (cellID, barcode_id); barcode_id is uint16
+        key, c = np.unique((cell << 16) | chunk['barcode_id'],
+                           return_counts=True)
+        keys.append(key)
+        key_counts.append(c)
+
+    agg = CellAggregate()
+    agg.cell_ids, = np.nonzero(counts)
+    agg.counts = counts[agg.cell_ids]
+    agg.centers = pos[agg.cell_ids] / agg.counts[:, np.newaxis]
+    agg.areas = areas[agg.cell_ids]
+    key = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+    row = np.searchsorted(agg.cell_ids, key >> 16)
+    agg.barcode_counts = sparse.coo_matrix(
+        (np.concatenate(key_counts) if keys else key, (row, key & 0xffff)),
+        shape=(len(agg.cell_ids), n_barcodes)).tocsr()
+    return agg
+
+
+def cell_aggregate(fname: str, cache=True, cache_fname: str = None) -> \
+        CellAggregate:
+    """
+    Aggregates of `fname`, read from the cache `cache_fname`
+    (default: `fname + '.cells.npz'`) if it is up to date, otherwise
+    computed and stored there.
+    """
+    if not cache:
+        return compute_aggregate(fname)
+    if cache_fname is None:
+        cache_fname = fname + '.cells.npz'
+    key = cache_key(fname, _CACHE_VERSION)
+    if path.exists(cache_fname):
+        agg = CellAggregate.load(cache_fname, key)
+        if agg is not None:
+            return agg
+    agg = compute_aggregate(fname)
+    try:
+        agg.save(cache_fname, key)
+    except OSError as e:
+        print(f'Could not write cache "{cache_fname}": {e}', file=sys.stderr)
+    return agg
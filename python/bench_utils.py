@@ -0,0 +1,54 @@
+"""
+Benchmark the compiled `utils` kernels against the previous numpy versions
+"""
+import numpy as np
+from timeit import timeit
+from typing import List
+from utils import is_sorted, group_index, unique_elements
+
+
+def is_sorted_numpy(arr) -> bool:
+    if arr.dtype.kind == 'u':
+        return all(np.diff(arr.astype(int)) >= 0)
+    return all(np.diff(arr) >= 0)
+
+
+def group_index_numpy(arr) -> List:
+    diff = np.diff(arr.astype(int) if arr.dtype.kind == 'u' else arr)
+    idx, = np.where(diff > 0)
+    return [0] + (idx + 1).tolist()
+
+
+def unique_elements_numpy(arr) -> List:
+    return arr[group_index_numpy(arr)]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('-n', '--size', type=int, default=10_000_000)
+    p.add_argument('-c', '--cells', type=int, default=100_000)
+    p.add_argument('-r', '--repeat', type=int, default=3)
+    args = p.parse_args()
+
+    cells = np.sort(np.random.randint(0, args.cells, size=args.size)
+                    .astype(np.uint32))
+    unsorted = cells.copy()
+    unsorted[len(cells) // 2] = args.cells
+
+    assert is_sorted(cells) == is_sorted_numpy(cells)
+    assert (group_index(cells) == group_index_numpy(cells)).all()
+    assert (unique_elements(cells) == unique_elements_numpy(cells)).all()
+
+    print(f'{args.size:,d} elements, {args.cells:,d} groups')
+    for name, arr in [('is_sorted', cells),
+                      ('is_sorted (unsorted)', unsorted),
+                      ('group_index', cells),
+                      ('unique_elements', cells)]:
+        func = name.split()[0]
+        new, old = globals()[func], globals()[func + '_numpy']
+        t_new = timeit(lambda: new(arr), number=args.repeat) / args.repeat
+        t_old = timeit(lambda: old(arr), number=args.repeat) / args.repeat
+        print(f'{name:22s} numba {t_new*1e3:9.2f}ms',
+              f'numpy {t_old*1e3:9.2f}ms  ({t_old / t_new:.0f}x)')
@@ -0,0 +1,122 @@
+"""
+Concave cell boundaries (alpha shapes) from one Delaunay triangulation
+of all points, see `docs/boundaries.md`
+"""
+import numpy as np
+from numba import njit
+from utils import GroupBy
+
+
+@njit(cache=True)
+def _trace_rings(src, dst, start_ptr):
+    """
+    Chain directed edges (sorted by `src`; those of vertex `v` being
+    `start_ptr[v]:start_ptr[v+1]`) into closed rings
+    """
+    m = len(src)
+    used = np.zeros(m, dtype=np.bool_)
+    next_out = start_ptr[:-1].copy()
+    verts = np.empty(m, dtype=np.int64)
+    ring_ptr = np.zeros(m + 1, dtype=np.int64)
+    k = 0
+    r = 0
+    for e in range(m):
+        if used[e]:
+            continue
+        cur = e
+        while not used[cur]:
+            used[cur] = True
+            verts[k] = src[cur]
+            k += 1
+            v = dst[cur]
+            while next_out[v] < start_ptr[v+1] and used[next_out[v]]:
+                next_out[v] += 1
+            if next_out[v] == start_ptr[v+1]:
+                break
+            cur = next_out[v]
+        r += 1
+        ring_ptr[r] = k
+    return verts, ring_ptr[:r+1]
+
+
+def alpha_triangles(coord: np.ndarray, cells: np.ndarray,
+                    max_radius: float) -> np.ndarray:
+    """
+    Triangles (counter-clockwise, shape `(m, 3)`) of the Delaunay
+    triangulation of `coord` whose corners belong to the same cell and
+    whose circumradius is at most `max_radius`
+    """
+    from scipy.spatial import Delaunay
+
+    tri = Delaunay(coord).simplices
+    tri = tri[(cells[tri[:, 0]] == cells[tri[:, 1]]) &
+              (cells[tri[:, 0]] == cells[tri[:, 2]])]
+    a, b, c = (coord[tri[:, k]].astype(np.float64) for k in range(3))
+    ab, ac, bc = b - a, c - a, c - b
+    cross = ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]
+    lens = np.sqrt((ab**2).sum(axis=1) * (ac**2).sum(axis=1) *
+                   (bc**2).sum(axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radius = lens / (2 * np.abs(cross))
+    tri = tri[(radius <= max_radius) & (cross != 0)]
+    cross = cross[(radius <= max_radius) & (cross != 0)]
+    cw = cross < 0
+    tri[cw] = tri[cw][:, [0, 2, 1]]
+    return tri
+
+
+def boundary_rings(coord: np.ndarray, tri: np.ndarray):
+    """
+    Closed boundary rings of the union of the triangles `tri`.
+    Outer boundaries are counter-clockwise, holes clockwise.
+
+    Result: flat point indices `verts`, ring offsets `ring_ptr`
+    and the signed areas of the rings
+    """
+    n = len(coord)
+    src = tri.ravel()
+    dst = tri[:, [1, 2, 0]].ravel()
+    key = src.astype(np.int64) * n + dst
+    boundary = ~np.isin(dst.astype(np.int64) * n + src, key)
+    src, dst = src[boundary], dst[boundary]
+    order = np.argsort(src, kind='stable')
+    src, dst = src[order], dst[order]
+    start_ptr = np.searchsorted(src, np.arange(n + 1))
+    verts, ring_ptr = _trace_rings(src, dst, start_ptr)
+
+    nxt = np.arange(1, len(verts) + 1)
+    nxt[ring_ptr[1:] - 1] = ring_ptr[:-1]
+    p, q = coord[verts].astype(np.float64), coord[verts[nxt]]
+    cross = p[:, 0] * q[:, 1] - q[:, 0] * p[:, 1]
+    areas = 0.5 * np.add.reduceat(cross, ring_ptr[:-1]) if len(verts) \
+        else np.zeros(0)
+    return verts, ring_ptr, areas
+
+
+def cell_boundaries(coord: np.ndarray, cells: np.ndarray,
+                    max_radius: float = 5.0):
+    """
+    Concave boundary polygon of every cell: the outer ring of largest
+    area of the alpha shape (triangles with circumradius at most
+    `max_radius`) of the cell's points; holes and smaller components are
+    dropped, as are cells without any triangle.
+
+    Result: `cell_ids`, the flat polygon vertices (coordinates) and the
+    offsets `indptr`, such that cell `cell_ids[i]` has the polygon
+    `vertices[indptr[i]:indptr[i+1]]`
+    """
+    coord = np.asarray(coord)
+    cells = np.asarray(cells)
+    tri = alpha_triangles(coord, cells, max_radius)
+    verts, ring_ptr, areas = boundary_rings(coord, tri)
+    ring_cell = cells[verts[ring_ptr[:-1]]]
+    order = np.lexsort((-areas, ring_cell))
+    groups = GroupBy(ring_cell[order])
+    best = order[groups.indptr[:-1]]
+    best = best[areas[best] > 0]
+    lens = ring_ptr[best + 1] - ring_ptr[best]
+    indptr = np.zeros(len(best) + 1, dtype=np.int64)
+    np.cumsum(lens, out=indptr[1:])
+    idx = np.repeat(ring_ptr[best] - indptr[:-1], lens) + \
+        np.arange(indptr[-1])
+    return ring_cell[best], coord[verts[idx]], indptr
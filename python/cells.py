@@ -5,24 +5,29 @@ import numpy as np
 import matplotlib.pyplot as plt
 from os.path import basename
 from typing import List
-from reader import load_merfish
+from reader import load_merfish, read_header, CellIndex, CellSorted
 from graph import euclidean_edge_length, delaunay_graph, plot_edges
-from utils import is_sorted, group_index
+from utils import is_sorted, GroupBy
 
 
-def load_cells(fname: str, cell_ids: List, verbose=True):
-    cell_ids = [int(i) for i in cell_ids]
+def load_cells(fname: str, cell_ids: List, verbose=True, index=True):
+    """
+    Records of the cells `cell_ids`, sorted by cellID.
+    Unsorted files are accessed via the sidecar `CellIndex`
+    (or, without `index`, by one `np.isin` pass over all cellIDs).
+    """
+    cell_ids = sorted(set(int(i) for i in cell_ids))
 
     if verbose:
         print("Analyzing", basename(fname))
-    df = load_merfish(fname)
-
-    df_cell_ids = np.array(df["cellID"])
-    mask = df_cell_ids == cell_ids[0]
-    for i in cell_ids[1:]:
-        mask |= df_cell_ids == i
-    df = df[mask]
-    df.sort(order='cellID')
+    if read_header(fname).version == 2:
+        df = CellSorted(fname).cells(cell_ids)
+    elif index:
+        df = CellIndex(fname).cells(cell_ids)
+    else:
+        df = load_merfish(fname)
+        df = df[np.isin(df["cellID"], cell_ids)]
+        df = df[np.argsort(df['cellID'], kind='stable')]
     if True:
         assert is_sorted(df['cellID'])
     if verbose:
@@ -39,21 +44,24 @@ if __name__ == '__main__':
     p.add_argument('-f', '--fname', type=str, default=_test_file_name())
     p.add_argument('-a', '--all-coords', action='store_true')
     p.add_argument('-c', '--convex', action='store_true')
+    p.add_argument('-k', '--concave', action='store_true')
+    p.add_argument('-r', '--radius', type=float, default=5.0,
+                   help='Maximal circumradius of the concave boundaries')
     p.add_argument('-d', '--delaunay', action='store_true')
     p.add_argument('-g', '--graph', action='store_true')
     args = p.parse_args()
 
     df = load_cells(args.fname, args.cell)
     fname = basename(args.fname)
-    cell_idx = group_index(df['cellID'])
-    cell_ids = df['cellID'][cell_idx]
+    cells = GroupBy(df['cellID'])
+    cell_ids = cells.keys
 
     if args.all_coords:
         coord_fields = [k for k, v in df.dtype.fields.items()
                         if v[0].shape == (2,)]
         for field in coord_fields:
             plt.figure(f"{fname}: '{field}' on cells {cell_ids}")
-            for cdf in np.split(df, cell_idx[1:]):
+            for cdf in cells.split(df):
                 coord = cdf[field]
                 plt.plot(coord[:, 0], coord[:, 1], '.')
 
@@ -61,18 +69,29 @@ if __name__ == '__main__':
         from scipy.spatial import ConvexHull
 
         field = 'abs_position'
-        for cdf in np.split(df, cell_idx[1:]):
+        for cdf in cells.split(df):
             coord = cdf[field]
             conv = ConvexHull(coord)
             v = coord[conv.vertices]
             plt.fill(v[:, 0], v[:, 1], alpha=0.5)
             plt.plot(coord[:, 0], coord[:, 1], '.')
 
+    if args.concave:
+        from boundaries import cell_boundaries
+
+        field = 'abs_position'
+        _, vertices, indptr = cell_boundaries(df[field], df['cellID'],
+                                              max_radius=args.radius)
+        for v in np.split(vertices, indptr[1:-1]):
+            plt.fill(v[:, 0], v[:, 1], alpha=0.5)
+        for cdf in cells.split(df):
+            plt.plot(*cdf[field].T, '.')
+
     if args.delaunay:
         from scipy.spatial import Delaunay
 
         field = 'abs_position'
-        for cdf in np.split(df, cell_idx[1:]):
+        for cdf in cells.split(df):
             coord = cdf[field]
             tri = Delaunay(coord)
             plt.triplot(coord[:, 0], coord[:, 1], tri.simplices, alpha=0.5)
@@ -95,7 +114,7 @@ if __name__ == '__main__':
         print(f'Selected {len(edges):,d} edges')
 
         # plot
-        for cdf in np.split(df, cell_idx[1:]):
+        for cdf in cells.split(df):
             plt.plot(*cdf[field].T, '.')
         plot_edges(edges, coord, alpha=0.5, color='black')
 
@@ -0,0 +1,63 @@
+"""
+Codebook as lookup tables over all 2^16 possible barcodes
+"""
+import numpy as np
+from reader import read_codebook
+
+
+NUM_BITS = 16
+
+
+class Codebook:
+    """
+    Barcodes of a codebook, indexed by barcode_id (the row in the codebook):
+
+    - `lookup[b]`: barcode_id of the barcode `b` (-1 if not in the codebook)
+    - `corrected[b]`: barcode_id of the codeword with Hamming distance at
+      most 1 to `b` (-1 if there is none or it is ambiguous)
+    - `neighbors[i]`: the `NUM_BITS` barcodes with distance 1 to codeword `i`
+    - `is_blank[i]`: whether codeword `i` is a blank
+
+    so decoding, error correction and blank detection of many records are
+    fancy indexing operations, e.g. `cb.lookup[records['barcode']]`.
+    """
+
+    def __init__(self, barcodes: np.ndarray, names: np.ndarray = None,
+                 ids: np.ndarray = None):
+        self.barcodes = np.asarray(barcodes, dtype=np.int64)
+        n = len(self.barcodes)
+        self.names = np.asarray(names if names is not None else [''] * n,
+                                dtype=object)
+        self.ids = np.asarray(ids if ids is not None else [''] * n,
+                              dtype=object)
+        self.is_blank = np.array([str(s).startswith('Blank-')
+                                  for s in self.names], dtype=bool)
+        barcode_ids = np.arange(n, dtype=np.int16)
+        self.lookup = np.full(1 << NUM_BITS, -1, dtype=np.int16)
+        self.lookup[self.barcodes] = barcode_ids
+
+        bits = 1 << np.arange(NUM_BITS)
+        self.neighbors = self.barcodes[:, np.newaxis] ^ bits
+        hits = np.bincount(self.neighbors.ravel(), minlength=1 << NUM_BITS)
+        self.corrected = np.full(1 << NUM_BITS, -1, dtype=np.int16)
+        self.corrected[self.neighbors.ravel()] = \
+            np.repeat(barcode_ids, NUM_BITS)
+        self.corrected[hits > 1] = -1
+        self.corrected[self.barcodes] = barcode_ids
+
+    @staticmethod
+    def read(fname: str) -> 'Codebook':
+        codes = read_codebook(fname)
+        return Codebook(codes['barcode'].values, names=codes['name'].values,
+                        ids=codes['id'].values)
+
+    def __len__(self) -> int:
+        return len(self.barcodes)
+
+    def decode(self, barcodes: np.ndarray) -> np.ndarray:
+        """barcode_ids of exact matches (-1 otherwise)"""
+        return self.lookup[np.asarray(barcodes) & ((1 << NUM_BITS) - 1)]
+
+    def correct(self, barcodes: np.ndarray) -> np.ndarray:
+        """barcode_ids after correcting (at most) one bit (-1 otherwise)"""
+        return self.corrected[np.asarray(barcodes) & ((1 << NUM_BITS) - 1)]
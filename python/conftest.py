@@ -0,0 +1,76 @@
+"""
+Shared test fixtures: synthetic merfish records and files, the codebook
+"""
+import numpy as np
+import pytest
+from os import path
+from reader import write_merfish
+
+
+def random_records(n: int, num_cells: int = 20, seed: int = 0):
+    """Synthetic merfish records (same layout as `cxx/record.hpp`)"""
+    dtype = np.dtype([('barcode', np.uint64),
+                      ('barcode_id', np.uint16),
+                      ('fov_id', np.uint16),
+                      ('total_magnitude', np.float32),
+                      ('pixel_centroid', np.uint16, 2),
+                      ('weighted_pixel_centroid', np.float32, 2),
+                      ('abs_position', np.float32, 2),
+                      ('area', np.uint16),
+                      ('pixel_trace_mean', np.float32, 16),
+                      ('pixel_trace_std', np.float32, 16),
+                      ('is_exact', np.uint8),
+                      ('error_bit', np.uint8),
+                      ('error_dir', np.uint8),
+                      ('av_distance', np.float32),
+                      ('cellID', np.uint32),
+                      ('inNucleus', np.uint8),
+                      ('distNucleus', np.float64),
+                      ('distPeriphery', np.float64)])
+    assert dtype.itemsize == 194
+    rng = np.random.RandomState(seed)
+    a = np.zeros(n, dtype=dtype)
+    a['barcode_id'] = rng.randint(0, 140, size=n)
+    a['barcode'] = rng.randint(0, 1 << 16, size=n)
+    a['fov_id'] = rng.randint(0, 9, size=n)
+    a['total_magnitude'] = rng.exponential(10.0, size=n)
+    a['abs_position'] = rng.uniform(0, 300, size=(n, 2))
+    a['pixel_centroid'] = rng.randint(0, 2048, size=(n, 2))
+    a['weighted_pixel_centroid'] = a['pixel_centroid']
+    a['area'] = rng.randint(1, 10, size=n)
+    a['error_bit'] = rng.randint(0, 17, size=n)
+    a['is_exact'] = a['error_bit'] == 0
+    a['cellID'] = rng.randint(0, num_cells, size=n)
+    a['inNucleus'] = rng.randint(0, 2, size=n)
+    a['distNucleus'] = rng.exponential(5.0, size=n)
+    a['distPeriphery'] = rng.exponential(5.0, size=n)
+    return a
+
+
+@pytest.fixture(name='random_records')
+def random_records_fixture():
+    """The `random_records` generator"""
+    return random_records
+
+
+@pytest.fixture
+def merfish_file(tmp_path):
+    """
+    Write records to `tmp_path / "a.bin"`: either the given array or
+    `random_records(n, **kwargs)`.
+    Result: file name and records
+    """
+    def write(a, **kwargs):
+        if isinstance(a, int):
+            a = random_records(a, **kwargs)
+        fname = str(tmp_path / "a.bin")
+        write_merfish(fname, a)
+        return fname, a
+
+    return write
+
+
+@pytest.fixture
+def codebook_fname() -> str:
+    """File name of the codebook in the repository"""
+    return path.join(path.dirname(__file__), "..", "data", "codebook.csv")
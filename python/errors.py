@@ -1,51 +1,124 @@
 import click
 import numpy as np
-from reader import load_merfish, read_codebook
+from codebook import Codebook, NUM_BITS
+from reader import iter_chunks
+from utils import grow
+
+
+class ErrorModel:
+    """
+    Error counts accumulated over chunks of records:
+
+    - `one_to_zero`, `zero_to_one`: corrected errors per bit position
+    - `blanks_pre`, `blanks_post`: assignments to the blank barcodes
+      before/after the correction
+    - `fov`, `cell`: rows `(#records, #1→0 errors, #0→1 errors)` per
+      fov_id/cellID
+    """
+
+    def __init__(self, codebook: Codebook):
+        self.codebook = codebook
+        blank_ids, = np.nonzero(codebook.is_blank)
+        self.blank_barcodes = codebook.barcodes[blank_ids]
+        # blank number per barcode_id; the last entry is for barcode_id -1
+        self.blank_index = np.full(len(codebook) + 1, -1, dtype=np.int64)
+        self.blank_index[blank_ids] = np.arange(len(blank_ids))
+        self.n = 0
+        self.one_to_zero = np.zeros(NUM_BITS, dtype=np.int64)
+        self.zero_to_one = np.zeros(NUM_BITS, dtype=np.int64)
+        self.blanks_pre = np.zeros(len(self.blank_barcodes), dtype=np.int64)
+        self.blanks_post = np.zeros(len(self.blank_barcodes), dtype=np.int64)
+        self.fov = np.zeros((0, 3), dtype=np.int64)
+        self.cell = np.zeros((0, 3), dtype=np.int64)
+
+    def add(self, chunk: np.ndarray):
+        """Count a chunk (fields barcode, error_bit, fov_id and cellID)"""
+        barcodes = chunk['barcode'].astype(np.int64) & ((1 << NUM_BITS) - 1)
+        error_bits = chunk['error_bit'].astype(np.int64)
+        # error_bit == 0 → no error, error_bit == n → error at bit (n-1)
+        has_error = error_bits > 0
+        bit = np.where(has_error, error_bits - 1, 0)
+        correction = np.where(has_error, 1 << bit, 0)
+        uncorrected = barcodes ^ correction
+        # the corrected barcode has a 1 where a 0 was read: 1 → 0 error
+        is_one = has_error & ((barcodes & correction) != 0)
+        is_zero = has_error & ~is_one
+
+        self.n += len(chunk)
+        self.one_to_zero += np.bincount(bit[is_one], minlength=NUM_BITS)
+        self.zero_to_one += np.bincount(bit[is_zero], minlength=NUM_BITS)
+        for counts, codes in [(self.blanks_pre, uncorrected),
+                              (self.blanks_post, barcodes)]:
+            idx = self.blank_index[self.codebook.decode(codes)]
+            counts += np.bincount(idx[idx >= 0], minlength=len(counts))
+
+        rows = np.column_stack([np.ones(len(chunk), dtype=np.int64),
+                                is_one, is_zero])
+        for name, key in [('fov', chunk['fov_id']), ('cell', chunk['cellID'])]:
+            table = grow(getattr(self, name), int(key.max()) + 1)
+            np.add.at(table, key, rows)
+            setattr(self, name, table)
+        return self
+
+    def rates(self, table: np.ndarray) -> np.ndarray:
+        """Per row: fraction of records with 1→0 and 0→1 errors"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return table[:, 1:] / table[:, :1]
+
+
+def estimate(merfish: str, codebook: str, chunk_records: int = 1 << 22) -> \
+        ErrorModel:
+    """Error model of the file `merfish` in one pass over its chunks"""
+    model = ErrorModel(Codebook.read(codebook))
+    fields = ['barcode', 'error_bit', 'fov_id', 'cellID']
+    for chunk in iter_chunks(merfish, fields, chunk_records=chunk_records):
+        model.add(chunk)
+    return model
+
+
+def _write_rates(fname: str, name: str, model: ErrorModel,
+                 table: np.ndarray):
+    ids, = np.nonzero(table[:, 0])
+    rates = model.rates(table[ids])
+    np.savetxt(fname, np.column_stack([ids, table[ids, 0], rates]),
+               delimiter=',', fmt=['%d', '%d', '%g', '%g'],
+               header=f'{name},records,one_to_zero,zero_to_one', comments='')
 
 
 @click.command()
 @click.argument("MERFISH", type=click.Path())
 @click.argument("CODEBOOK", type=click.Path())
-def estimate_errors(merfish: str, codebook: str):
-    """Calculate field-of-view dimensions and overlap.
+@click.option("--per-fov", type=click.Path(), default=None,
+              help="Write error rates per fov (csv)")
+@click.option("--per-cell", type=click.Path(), default=None,
+              help="Write error rates per cell (csv)")
+def estimate_errors(merfish: str, codebook: str, per_fov: str, per_cell: str):
+    """Estimate the bit error rates and count the blank barcodes.
     """
-    data = load_merfish(merfish)[['barcode', 'error_bit']]
-    num_records = data.shape[0]
-    error_bits = np.array(data['error_bit'], dtype=np.uint32)
-    barcodes = data['barcode']
-
-    correction = 1 << (error_bits - 1)  # error_bit == 0 → no error, error_bit == n → error at position (n-1)
-    correction[error_bits == 0] = 0
-    uncorrected_barcodes = barcodes ^ correction
-    num_corrected_barcodes = np.count_nonzero(error_bits)
-    assert num_corrected_barcodes == np.sum(uncorrected_barcodes != barcodes)
-
-    one_to_zero_errors = (barcodes & correction)
-    zero_to_one_errors = ((~barcodes) & correction)
+    model = estimate(merfish, codebook)
+    num_records = model.n
 
     print("One → Zero errors (for each index):")
-    sel = (1 << np.arange(0, 16)).reshape((-1, 1))
-    print('\n'.join(map(str, zip(range(16), np.sum(one_to_zero_errors == sel, axis=1) / num_records))))
-    # for i in range(16):
-    #     print(f"{i}: {np.sum(one_to_zero_errors == (1 << i)) / num_records}")
+    print('\n'.join(map(str, zip(range(NUM_BITS),
+                                 (model.one_to_zero / num_records).tolist()))))
 
     print()
     print("Zero → One errors (for each index):")
-    print('\n'.join(map(str, zip(range(16), np.sum(zero_to_one_errors == sel, axis=1) / num_records))))
-    # for i in range(16):
-    #     print(f"{i}: {np.sum(zero_to_one_errors == (1 << i)) / num_records}")
-
-    codes = read_codebook(codebook)[['name', 'barcode']]
-    blanks = codes[codes['name'].str.startswith('Blank-')]
-    blank_barcodes_str = list(map(bin, blanks['barcode'].values))
-    blank_barcodes = blanks['barcode'].values.reshape((-1, 1))
+    print('\n'.join(map(str, zip(range(NUM_BITS),
+                                 (model.zero_to_one / num_records).tolist()))))
 
+    blank_barcodes_str = list(map(bin, model.blank_barcodes))
     print()
     print(f"Assigned blank counts (pre-correction):\n"
-          f"{dict(zip(blank_barcodes_str, np.sum(uncorrected_barcodes == blank_barcodes, axis=1)))}")
+          f"{dict(zip(blank_barcodes_str, model.blanks_pre.tolist()))}")
     print()
     print(f"Assigned blank counts (post-correction):\n"
-          f"{dict(zip(blank_barcodes_str, np.sum(barcodes == blank_barcodes, axis=1)))}")
+          f"{dict(zip(blank_barcodes_str, model.blanks_post.tolist()))}")
+
+    if per_fov:
+        _write_rates(per_fov, 'fov_id', model, model.fov)
+    if per_cell:
+        _write_rates(per_cell, 'cellID', model, model.cell)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,83 @@
+"""
+Export merfish binaries to HDF5 (one dataset per field), streamed in
+chunks and compressed in parallel threads, and load them back
+"""
+import zlib
+import numpy as np
+from typing import List
+from reader import load_merfish, iter_chunks
+
+
+def write_hdf5(fname: str, out: str, fields: List[str] = None,
+               chunk_rows: int = 1 << 16, level: int = 1,
+               threads: int = None, chunk_records: int = 1 << 22):
+    """
+    Write the `fields` (default: all) of the merfish file `fname` as
+    datasets of the HDF5 file `out`.
+
+    The records are streamed in chunks of `chunk_records` from the memmap;
+    every dataset is split into HDF5 chunks of `chunk_rows` records that
+    are deflated (zlib `level`, 0: uncompressed) by `threads` worker
+    threads and written as raw chunks, i.e. no compression in the HDF5
+    library (which would be single threaded).
+    """
+    import h5py
+    from concurrent.futures import ThreadPoolExecutor
+
+    array = load_merfish(fname)
+    if fields is None:
+        fields = list(array.dtype.names)
+    n = len(array)
+    rows = max(1, min(chunk_rows, n))
+    chunk_records = max(rows, chunk_records // rows * rows)
+
+    def encode(task):
+        f, offset, data = task
+        if len(data) < rows:
+            buf = np.zeros((rows,) + data.shape[1:], dtype=data.dtype)
+            buf[:len(data)] = data
+            data = buf
+        raw = np.ascontiguousarray(data).tobytes()
+        return f, offset, zlib.compress(raw, level) if level else raw
+
+    with h5py.File(out, 'w') as io, ThreadPoolExecutor(threads) as pool:
+        io.attrs['fields'] = fields
+        dsets = {}
+        for f in fields:
+            dtype = array.dtype[f]
+            dsets[f] = io.create_dataset(
+                f, shape=(n,) + dtype.shape, dtype=dtype.base,
+                chunks=(rows,) + dtype.shape,
+                compression='gzip' if level else None,
+                compression_opts=level if level else None)
+        start = 0
+        for chunk in iter_chunks(fname, fields, chunk_records=chunk_records):
+            tasks = [(f, start + i, chunk[f][i:i + rows])
+                     for f in fields for i in range(0, len(chunk), rows)]
+            for f, offset, data in pool.map(encode, tasks):
+                ndim = len(dsets[f].shape)
+                dsets[f].id.write_direct_chunk((offset,) + (0,) * (ndim - 1),
+                                               data)
+            start += len(chunk)
+
+
+def load_hdf5(fname: str, fields: List[str] = None, start: int = 0,
+              stop: int = None) -> np.ndarray:
+    """
+    Records `start:stop` of an HDF5 file written by `write_hdf5` as
+    structured array with the `fields` (default: all stored ones)
+    """
+    import h5py
+
+    with h5py.File(fname, 'r') as io:
+        if fields is None:
+            fields = [str(f) for f in io.attrs['fields']]
+        dsets = [io[f] for f in fields]
+        dtype = np.dtype([(f, d.dtype, d.shape[1:])
+                          for f, d in zip(fields, dsets)])
+        n = len(dsets[0]) if dsets else 0
+        start, stop, _ = slice(start, stop).indices(n)
+        array = np.empty(stop - start, dtype=dtype)
+        for f, d in zip(fields, dsets):
+            array[f] = d[start:stop]
+    return array
@@ -8,6 +8,8 @@ etc.
 import numpy as np
 from os import path
 from reader import read_header, load_merfish
+from summary import summarize
+from export import write_hdf5
 from data import _test_file_name
 
 
@@ -20,9 +22,17 @@ if __name__ == '__main__':
     p.add_argument('-c', '--c_struct', action='store_true')
     p.add_argument('-s', '--stats', action='store_true')
     p.add_argument('-5', '--hdf5', action='store_true')
+    p.add_argument('-F', '--fields', nargs='+', default=None,
+                   help='Fields to export to HDF5 (default: all)')
     p.add_argument('-C', '--check', action='store_true')
+    p.add_argument('-j', '--jobs', type=int, default=None,
+                   help='Number of processes (default: all cores)')
     args = p.parse_args()
 
+    if (args.stats or args.plot_hist) and \
+       not (args.c_struct or args.hdf5):
+        summaries = summarize(args.fname, processes=args.jobs)
+
     for fname in args.fname:
         if args.c_struct:
             header = read_header(fname)
@@ -31,31 +41,26 @@ if __name__ == '__main__':
         array = load_merfish(fname)
 
         if args.hdf5:
-            import h5py
-
             out = path.basename(fname) + ".h5"
-            with h5py.File(out, 'w') as io:
-                for f in array.dtype.fields:
-                    print('writing', f, '...', end='', flush=True)
-                    io.create_dataset(f, data=array[f], compression=1)
-                    print()
+            print('writing', out, '...', end='', flush=True)
+            write_hdf5(fname, out, fields=args.fields, threads=args.jobs)
+            print()
             break
 
-        def print_range(i, indent=20):
-            min_x, min_y = array[i].min(axis=0)
-            max_x, max_y = array[i].max(axis=0)
+        def print_range(i, lo, hi, indent=20):
+            (min_x, min_y), (max_x, max_y) = lo, hi
             print(i.ljust(indent), '= [', min_x, ',', max_x, '] x [',
                   min_y, ',', max_y, ']')
 
         if args.stats:
-            pp = ['pixel_centroid',
-                  'abs_position',
-                  'weighted_pixel_centroid']
-            indent = max(map(len, pp)) + 1
-            for i in pp:
-                print_range(i, indent=indent)
+            s = summaries[fname]
+            if len(args.fname) > 1:
+                print(fname)
+            indent = max(map(len, s.lo)) + 1
+            for i in s.lo:
+                print_range(i, s.lo[i], s.hi[i], indent=indent)
 
-            print(f"in nuclues: {array['inNucleus'].mean()*100:.2f}%")
+            print(f"in nuclues: {s.mean('inNucleus')*100:.2f}%")
 
         if args.check:
             assert array['inNucleus'].min() >= 0
@@ -65,24 +70,24 @@ if __name__ == '__main__':
 
         if args.plot_hist:
             import matplotlib.pyplot as plt
-            from scipy import stats
 
-            magnitude = stats.trim1(array['total_magnitude'], 0.001)
+            hists = summaries[fname].hists
             plt.figure(f"{fname}: total_magnitude")
-            plt.hist(magnitude, log=True, bins=300)
+            hists['total_magnitude'].trim1(0.001).plot()
+            plt.yscale('log')
 
             cut = 0.0001
             plt.figure(f"{fname}: distNucleus (trim1 {cut*100}%)")
-            plt.hist(stats.trim1(array['distNucleus'], cut),
-                     bins=300, log=True, density=True)
+            hists['distNucleus'].trim1(cut).plot(density=True)
+            plt.yscale('log')
 
             plt.figure(f"{fname}: error_bit")
-            plt.hist(array['error_bit'],
-                     log=True, density=True, rwidth=0.7, align='left',
-                     bins=range(0, 17))
+            hists['error_bit'].plot(density=True, fill=True)
+            plt.yscale('log')
 
             plt.figure(f"{fname}: area")
-            plt.hist(array['area'], log=True, density=True, bins=100)
+            hists['area'].plot(density=True)
+            plt.yscale('log')
 
             if False:
                 plt.plot(array['pixel_centroid'][:, 0],
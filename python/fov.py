@@ -1,28 +1,66 @@
 import click
 import numpy as np
 
-from reader import load_merfish
+from reader import iter_chunks
+
+
+def fov_boxes(fname: str):
+    """
+    Bounding boxes of all field-of-views in one pass over `fname`.
+
+    Result: `fov_ids`, point `counts` and `boxes` (rows `xmin, xmax,
+    ymin, ymax`) of the non-empty fovs
+    """
+    counts = np.zeros(1 << 16, dtype=np.int64)     # fov_id is uint16
+    lo = np.full((1 << 16, 2), np.inf)
+    hi = np.full((1 << 16, 2), -np.inf)
+    for chunk in iter_chunks(fname, ['fov_id', 'abs_position']):
+        fov, pos = chunk['fov_id'], chunk['abs_position']
+        counts += np.bincount(fov, minlength=len(counts))
+        np.minimum.at(lo, fov, pos)
+        np.maximum.at(hi, fov, pos)
+    fov_ids, = np.nonzero(counts)
+    boxes = np.stack([lo[fov_ids, 0], hi[fov_ids, 0],
+                      lo[fov_ids, 1], hi[fov_ids, 1]], axis=1)
+    return fov_ids, counts[fov_ids], boxes
+
+
+def fov_overlaps(boxes: np.ndarray):
+    """
+    All pairs of overlapping `boxes` (rows `xmin, xmax, ymin, ymax`),
+    found by sweeping along x (only boxes starting before the current
+    one ends are compared).
+
+    Result: index pairs (shape `(m, 2)`) and their overlap areas
+    """
+    order = np.argsort(boxes[:, 0], kind='stable')
+    b = boxes[order]
+    end = np.searchsorted(b[:, 0], b[:, 1], side='right')
+    num = np.maximum(end - np.arange(len(b)) - 1, 0)
+    i = np.repeat(np.arange(len(b)), num)
+    j = i + 1 + np.arange(len(i)) - np.repeat(np.cumsum(num) - num, num)
+    dx = np.minimum(b[i, 1], b[j, 1]) - np.maximum(b[i, 0], b[j, 0])
+    dy = np.minimum(b[i, 3], b[j, 3]) - np.maximum(b[i, 2], b[j, 2])
+    sel = (dx > 0) & (dy > 0)
+    pairs = np.stack([order[i[sel]], order[j[sel]]], axis=1)
+    return pairs, dx[sel] * dy[sel]
 
 
 @click.command()
 @click.argument("FILE", type=click.File())
 @click.option("--plot", is_flag=True, help="Plot field of views")
-def fov(file: click.File, plot: bool):
+@click.option("--overlaps", type=click.Path(), default=None,
+              help="Write the table of overlapping fovs (csv)")
+def fov(file: click.File, plot: bool, overlaps: str):
     """Calculate field-of-view dimensions and overlap.
     """
-    data = load_merfish(file.name)[['fov_id', 'abs_position']]
-    shapes = []
-    fov_width, fov_height = 0, 0
-    fovs = data['fov_id']
-    # this is slow. I don't mind, tho.
-    for fov_id in np.unique(fovs):
-        mask = fovs == fov_id
-        d = data['abs_position'][mask]
-        (min_x, min_y), (max_x, max_y) = d.min(axis=0), d.max(axis=0)
-        shapes.append(dict(type='rect', x0=min_x, x1=max_x, y0=min_y, y1=max_y))
-        fov_width = max(max_x - min_x, fov_width)
-        fov_height = max(max_y - min_y, fov_height)
-    (xmin, ymin), (xmax, ymax) = data['abs_position'].min(axis=0), data['abs_position'].max(axis=0)
+    fov_ids, counts, boxes = fov_boxes(file.name)
+    shapes = [dict(type='rect', x0=x0, x1=x1, y0=y0, y1=y1)
+              for x0, x1, y0, y1 in boxes]
+    fov_width = (boxes[:, 1] - boxes[:, 0]).max()
+    fov_height = (boxes[:, 3] - boxes[:, 2]).max()
+    xmin, xmax = boxes[:, 0].min(), boxes[:, 1].max()
+    ymin, ymax = boxes[:, 2].min(), boxes[:, 3].max()
     abs_width, abs_height = xmax - xmin, ymax - ymin
 
     num_fovs_x, remainder_x = divmod(abs_width, fov_width)
@@ -30,6 +68,15 @@ def fov(file: click.File, plot: bool):
     print(f"{abs_width} x {abs_height}")
     print(f"{num_fovs_x} fovs with width  {fov_width} and remainder {remainder_x}")
     print(f"{num_fovs_y} fovs with height {fov_height} and remainder {remainder_y}")
+
+    pairs, areas = fov_overlaps(boxes)
+    print(f"{len(fov_ids)} fovs with {counts.min()} to {counts.max()} points")
+    print(f"{len(pairs)} overlapping pairs of fovs"
+          + (f", mean overlap area {areas.mean()}" if len(pairs) else ""))
+    if overlaps:
+        table = np.column_stack([fov_ids[pairs], areas])
+        np.savetxt(overlaps, table, delimiter=',', fmt=['%d', '%d', '%g'],
+                   header='fov_a,fov_b,area', comments='')
     if plot:
         from plotly.offline import plot as oplot
         from plotly.graph_objs import Figure, Layout
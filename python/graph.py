@@ -52,6 +52,267 @@ def delaunay_graph(coord: np.ndarray) -> np.ndarray:
     return edges
 
 
+def unique_edges(i: np.ndarray, j: np.ndarray, n: int) -> np.ndarray:
+    """
+    Unique undirected edges `(i, j)`, `i < j`, sorted lexicographically,
+    of the pairs `i[k], j[k]` of `n` points (loops are dropped)
+    """
+    lo, hi = np.minimum(i, j), np.maximum(i, j)
+    key = np.unique(lo[lo < hi].astype(np.int64) * n + hi[lo < hi])
+    return np.stack([key // n, key % n], axis=1)
+
+
+def edges_to_csr(edges: np.ndarray, n: int):
+    """
+    Symmetric adjacency of the undirected `edges` over `n` nodes in CSR
+    format: the neighbours of `i` are `indices[indptr[i]:indptr[i+1]]`
+    (sorted)
+    """
+    src = np.concatenate([edges[:, 0], edges[:, 1]])
+    dst = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order].astype(np.int32)
+
+
+def knn_graph(coord: np.ndarray, k: int, workers: int = -1) -> np.ndarray:
+    """
+    Edges connecting every point of `coord` (shape `nx2`) to its `k`
+    nearest neighbours, queried in parallel by `workers` threads
+    (`-1`: all cores).
+    As the relation is symmetrized, a point may have more than `k`
+    neighbours (but `k` is a lower bound for `n > k`).
+
+    Result: unique edges `(i, j)`, `i < j`, sorted (array of shape `mx2`)
+    """
+    from scipy.spatial import cKDTree
+
+    assert coord.ndim == 2
+    n = len(coord)
+    _, idx = cKDTree(coord).query(coord, k=k + 1, workers=workers)
+    i = np.repeat(np.arange(n), k + 1)
+    j = idx.ravel()
+    valid = j < n       # missing neighbours are reported as index n
+    return unique_edges(i[valid], j[valid], n)
+
+
+def radius_graph(coord: np.ndarray, r: float) -> np.ndarray:
+    """
+    Edges between all pairs of points of `coord` (shape `nx2`) with
+    distance at most `r` (`cKDTree.query_pairs`, which yields every pair
+    once, without Python overhead per point).
+
+    Result: unique edges `(i, j)`, `i < j`, sorted (array of shape `mx2`)
+    """
+    from scipy.spatial import cKDTree
+
+    assert coord.ndim == 2
+    pairs = cKDTree(coord).query_pairs(r, output_type='ndarray')
+    pairs = np.sort(pairs, axis=1)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def triangle_edges(tri: np.ndarray, n: int) -> np.ndarray:
+    """
+    Unique edges `(i, j)`, `i < j`, of the triangles `tri` (shape `mx3`)
+    over `n` points, sorted lexicographically
+    """
+    e = tri[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2)
+    return unique_edges(e[:, 0], e[:, 1], n)
+
+
+def circumcenters(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> \
+        np.ndarray:
+    """Circumcenters of the triangles with corners `a`, `b`, `c`"""
+    ab, ac = b - a, c - a
+    d = 2 * (ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0])
+    ab2, ac2 = (ab**2).sum(axis=1), (ac**2).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ux = (ac[:, 1] * ab2 - ab[:, 1] * ac2) / d
+        uy = (ab[:, 0] * ac2 - ac[:, 0] * ab2) / d
+    return a + np.stack([ux, uy], axis=1)
+
+
+def _tile_triangles(task):
+    """
+    Delaunay triangles of the points `coord` (global indices `idx`)
+    of one tile including its overlap, restricted to those triangles
+    whose circumcenter lies in the `core` box `xmin, xmax, ymin, ymax`
+    """
+    from scipy.spatial import Delaunay
+
+    coord, idx, core = task
+    if len(coord) < 3:
+        return np.zeros((0, 3), dtype=idx.dtype)
+    tri = Delaunay(coord).simplices
+    p = coord.astype(np.float64)
+    cc = circumcenters(p[tri[:, 0]], p[tri[:, 1]], p[tri[:, 2]])
+    own = (core[0] <= cc[:, 0]) & (cc[:, 0] < core[1]) & \
+        (core[2] <= cc[:, 1]) & (cc[:, 1] < core[3])
+    return idx[tri[own]]
+
+
+def tiled_delaunay_graph(coord: np.ndarray, tile: float = None,
+                         overlap: float = None, tile_points: int = 1 << 20,
+                         processes: int = None) -> np.ndarray:
+    """
+    Edges of the Delaunay triangulation of `coord` (shape `nx2`) like
+    `delaunay_graph`, but assembled from the triangulations of square
+    tiles of side length `tile` (default: about `tile_points` points per
+    tile), each enlarged by `overlap` (default: ten mean point distances)
+    on every side.
+    The tiles are triangulated by `processes` worker processes
+    (default: all cores; `processes=1` runs in this process).
+
+    Every tile contributes the triangles whose circumcenter lies inside
+    it (the outer tiles extend to infinity), so each triangle is taken
+    exactly once.  Triangles with circumradius at most `overlap` are
+    exactly those of the global triangulation; larger ones (along the
+    convex hull or around big empty areas) may deviate.
+
+    Result: unique edges `(i, j)`, `i < j`, sorted (array of shape `mx2`)
+    """
+    from multiprocessing import get_context
+
+    assert coord.ndim == 2
+    assert coord.shape[1] == 2, f"coord have to be 2d array"
+    n = len(coord)
+    lo, hi = coord.min(axis=0), coord.max(axis=0)
+    extent = np.maximum(hi - lo, np.finfo(np.float64).tiny)
+    area = float(np.prod(extent))
+    if tile is None:
+        tile = np.sqrt(area * tile_points / n)
+    if overlap is None:
+        overlap = 10 * np.sqrt(area / n)
+    nx, ny = np.maximum(np.ceil(extent / tile), 1).astype(int)
+
+    bounds = [np.concatenate([[-np.inf], lo[k] + tile * np.arange(1, m),
+                              [np.inf]]) for k, m in [(0, nx), (1, ny)]]
+    # range of tiles (per axis) whose enlarged box contains each point
+    first, last = [], []
+    for k, m in [(0, nx), (1, ny)]:
+        for rng, sign in [(first, -1), (last, 1)]:
+            t = np.floor((coord[:, k] + sign * overlap - lo[k]) / tile)
+            rng.append(np.clip(t, 0, m - 1).astype(np.int64))
+    span_y = last[1] - first[1] + 1
+    copies = (last[0] - first[0] + 1) * span_y
+    point = np.repeat(np.arange(n), copies)
+    k = np.arange(len(point)) - np.repeat(np.cumsum(copies) - copies, copies)
+    tile_id = (first[0][point] + k // span_y[point]) * ny + \
+        first[1][point] + k % span_y[point]
+    order = np.argsort(tile_id, kind='stable')
+    point = point[order]
+    indptr = np.zeros(nx * ny + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tile_id, minlength=nx * ny), out=indptr[1:])
+
+    tasks = []
+    for i in range(nx):
+        for j in range(ny):
+            core = (bounds[0][i], bounds[0][i+1],
+                    bounds[1][j], bounds[1][j+1])
+            idx = point[indptr[i * ny + j]:indptr[i * ny + j + 1]]
+            tasks.append((coord[idx], idx, np.array(core)))
+    if processes == 1 or len(tasks) == 1:
+        triangles = list(map(_tile_triangles, tasks))
+    else:
+        with get_context('spawn').Pool(processes) as pool:
+            triangles = pool.map(_tile_triangles, tasks)
+    return triangle_edges(np.concatenate(triangles), n)
+
+
+class SpatialGraph:
+    """
+    Undirected graph on points in the plane, stored as symmetric CSR
+    adjacency: the neighbours of node `i` are
+    `indices[indptr[i]:indptr[i+1]]` (sorted, int32) at the distances
+    `lengths[indptr[i]:indptr[i+1]]`; `coord` are the node positions.
+    """
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray,
+                 coord: np.ndarray):
+        coord = np.asarray(coord)
+        assert coord.ndim == 2
+        assert len(indptr) == len(coord) + 1
+        indptr = np.asarray(indptr, dtype=np.int64)
+        rows = np.repeat(np.arange(len(coord)), np.diff(indptr))
+        order = np.lexsort((indices, rows))
+        self.indptr = indptr
+        self.indices = np.asarray(indices, dtype=np.int32)[order]
+        self.coord = coord
+        d = coord[rows].astype(np.float64) - coord[self.indices]
+        self.lengths = np.sqrt((d**2).sum(axis=1))
+
+    @staticmethod
+    def from_edges(edges: np.ndarray, coord: np.ndarray) -> 'SpatialGraph':
+        """Graph of the undirected `edges` (shape `mx2`)"""
+        return SpatialGraph(*edges_to_csr(edges, len(coord)), coord)
+
+    @staticmethod
+    def from_sparse(mat, coord: np.ndarray) -> 'SpatialGraph':
+        """Graph of the non-zeros of the (symmetric) sparse matrix `mat`"""
+        from scipy import sparse
+
+        mat = sparse.csr_matrix(mat)
+        mat.eliminate_zeros()
+        return SpatialGraph(mat.indptr, mat.indices, coord)
+
+    @staticmethod
+    def delaunay(coord: np.ndarray) -> 'SpatialGraph':
+        """Delaunay graph, directly from the triangulation's CSR"""
+        from scipy.spatial import Delaunay
+
+        indptr, indices = Delaunay(coord).vertex_neighbor_vertices
+        return SpatialGraph(indptr, indices, coord)
+
+    def __len__(self) -> int:
+        return len(self.coord)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices) // 2
+
+    def degree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def neighbors(self, i: int) -> np.ndarray:
+        """Neighbours of node `i` (a view, no copy)"""
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    def edges(self) -> np.ndarray:
+        """Edges `(i, j)`, `i < j`, sorted (array of shape `mx2`)"""
+        rows = np.repeat(np.arange(len(self), dtype=np.int32),
+                         self.degree())
+        upper = rows < self.indices
+        return np.stack([rows[upper], self.indices[upper]], axis=1)
+
+    def to_sparse(self, weights: np.ndarray = None):
+        """
+        Adjacency as `scipy.sparse.csr_matrix` with the edge lengths
+        (or the per entry `weights`) as values
+        """
+        from scipy import sparse
+
+        data = self.lengths if weights is None else weights
+        return sparse.csr_matrix((data, self.indices, self.indptr),
+                                 shape=(len(self), len(self)))
+
+    def subgraph(self, keep: np.ndarray) -> 'SpatialGraph':
+        """Graph without the entries where `keep` (per entry) is false"""
+        rows = np.repeat(np.arange(len(self)), self.degree())
+        indptr = np.zeros_like(self.indptr)
+        np.cumsum(np.bincount(rows[keep], minlength=len(self)),
+                  out=indptr[1:])
+        return SpatialGraph(indptr, self.indices[keep], self.coord)
+
+    def save(self, fname: str, values: np.ndarray = None):
+        store_graph(fname, self.edges(), values, self.coord)
+
+    @staticmethod
+    def load(fname: str) -> 'SpatialGraph':
+        return load_graph(fname)[0]
+
+
 def plot_edges(edges: np.ndarray, coord: np.ndarray, ax=None, **args):
     from matplotlib.collections import LineCollection
     import matplotlib.pyplot as plt
@@ -73,10 +334,29 @@ def store_graph(fname: str, edges: np.ndarray, values: np.ndarray,
                 coord: np.ndarray):
     import h5py
 
+    # chunked, byte shuffled and fast deflate instead of gzip level 5
+    args = dict(chunks=True, shuffle=True, compression='gzip',
+                compression_opts=1)
     with h5py.File(fname, 'w') as io:
-        io.create_dataset('edges', data=edges, compression=5)
-        io.create_dataset('input', data=values, compression=5)
-        io.create_dataset('coord', data=coord, compression=5)
+        io.create_dataset('edges', data=edges, **args)
+        if values is not None:
+            io.create_dataset('input', data=values, **args)
+        io.create_dataset('coord', data=coord, **args)
+
+
+def load_graph(fname: str):
+    """
+    Read a graph written by `store_graph`.
+
+    Result: `SpatialGraph` and the node `input` values (`None` if absent)
+    """
+    import h5py
+
+    with h5py.File(fname, 'r') as io:
+        edges = io['edges'][()]
+        coord = io['coord'][()]
+        values = io['input'][()] if 'input' in io else None
+    return SpatialGraph.from_edges(edges, coord), values
 
 
 if __name__ == '__main__':
@@ -89,6 +369,12 @@ if __name__ == '__main__':
     p = argparse.ArgumentParser(description=__doc__)
     p.add_argument('fname', nargs='?', type=str, default=moffit_example)
     p.add_argument('-p', '--plot', action='store_true')
+    p.add_argument('-t', '--tile', type=float, default=None,
+                   help='Triangulate tiles of this size in parallel')
+    p.add_argument('-k', '--knn', type=int, default=None,
+                   help='k nearest neighbour graph instead of Delaunay')
+    p.add_argument('-r', '--radius', type=float, default=None,
+                   help='Radius graph instead of Delaunay')
     p.add_argument('-o', '--out', type=str, default=None,
                    help='Write an HDF5 instance')
     args = p.parse_args()
@@ -98,11 +384,18 @@ if __name__ == '__main__':
     values = df[df.columns[-1]]
     coord = df[df.columns[:2]].values
 
-    edges = delaunay_graph(coord)
-    edges = delaunay_graph(coord)
-    lens = euclidean_edge_length(edges, coord)
-    thres = lens.mean() + 1.2*lens.std()
-    edges = edges[lens <= thres]
+    if args.knn:
+        edges = knn_graph(coord, args.knn)
+    elif args.radius:
+        edges = radius_graph(coord, args.radius)
+    else:
+        if args.tile:
+            edges = tiled_delaunay_graph(coord, tile=args.tile)
+        else:
+            edges = delaunay_graph(coord)
+        lens = euclidean_edge_length(edges, coord)
+        thres = lens.mean() + 1.2*lens.std()
+        edges = edges[lens <= thres]
 
     zeros = values <= 0
     zr = zeros.sum() / len(values)
@@ -4,8 +4,8 @@ Visualize MERFISH data
 import numpy as np
 import matplotlib.pyplot as plt
 from os import path
-from numba import njit
-from reader import load_merfish
+from numba import njit, prange
+from reader import load_merfish, query_bbox
 from data import _test_file_name
 
 
@@ -15,6 +15,152 @@ def fill_img(img, x, y, v):
         img[xi, yi] += v[i]
 
 
+@njit(cache=True)
+def bucket_order(x, band, nbands):
+    """Counting sort of the points by their band `x // band`"""
+    indptr = np.zeros(nbands + 1, dtype=np.int64)
+    for i in range(len(x)):
+        indptr[x[i] // band + 1] += 1
+    for b in range(nbands):
+        indptr[b+1] += indptr[b]
+    pos = indptr[:-1].copy()
+    order = np.empty(len(x), dtype=np.int64)
+    for i in range(len(x)):
+        b = x[i] // band
+        order[pos[b]] = i
+        pos[b] += 1
+    return order, indptr
+
+
+def check_pixels(x, y, width, height):
+    """
+    Raise a `ValueError` unless all pixels `(x, y)` lie inside the
+    `width x height` image (the numba kernels do not check bounds)
+    """
+    if len(x) != len(y):
+        raise ValueError(f'{len(x)} x but {len(y)} y coordinates')
+    if len(x) == 0:
+        return
+    if x.min() < 0 or x.max() >= width or y.min() < 0 or y.max() >= height:
+        raise ValueError(f'pixels [{x.min()}, {x.max()}] x '
+                         f'[{y.min()}, {y.max()}] outside of the '
+                         f'{width} x {height} image')
+
+
+@njit(parallel=True, cache=True)
+def _rasterize(img, x, y, cells, weights, colortab, order, indptr, scale,
+               vmax):
+    ncolors = len(colortab)
+    nchan = img.shape[-1]
+    for b in prange(len(indptr) - 1):
+        for k in range(indptr[b], indptr[b+1]):
+            i = order[k]
+            c = cells[i] % ncolors
+            w = weights[i] * scale
+            for j in range(nchan):
+                img[x[i], y[i], j] = min(img[x[i], y[i], j] +
+                                         w * colortab[c, j], vmax)
+
+
+def rasterize(x, y, cells, colortab, width=None, height=None, weights=None,
+              dtype=np.float32, band=64) -> np.ndarray:
+    """
+    Accumulate the colors `colortab[cells % len(colortab)]` (times
+    `weights`) of the points at the pixels `(x, y)` into an image of shape
+    `(width, height, colortab.shape[1])`; pixels outside of the image
+    raise a `ValueError`.
+
+    The points are bucketed into bands of `band` image rows which are
+    filled in parallel, each band by one thread, so there is no need for
+    locks or per-thread copies of the image.
+    With `dtype=np.uint16`, `[0, 1]` is mapped to `[0, 65535]` (saturating).
+    """
+    width = x.max() + 1 if width is None else width
+    height = y.max() + 1 if height is None else height
+    check_pixels(x, y, width, height)
+    if weights is None:
+        weights = np.ones(1, dtype=np.float32)
+        weights = np.broadcast_to(weights, x.shape)
+    scale, vmax = (65535.0, 65535.0) if np.dtype(dtype) == np.uint16 \
+        else (1.0, np.inf)
+    nbands = -(-width // band)
+    order, indptr = bucket_order(x, band, nbands)
+    img = np.zeros((width, height, colortab.shape[1]), dtype=dtype)
+    _rasterize(img, x, y, cells, weights, colortab.astype(np.float32),
+               order, indptr, scale, vmax)
+    return img
+
+
+def rasterize_strips(x, y, cells, colortab, width, height, strip=256,
+                     weights=None, dtype=np.float32):
+    """
+    Like `rasterize`, but yield the image in consecutive strips of `strip`
+    rows, so only one strip is in memory at a time (e.g. to `push` it to a
+    `PyramidWriter`).
+    """
+    check_pixels(x, y, width, height)
+    order, indptr = bucket_order(x, strip, -(-width // strip))
+    for b in range(len(indptr) - 1):
+        idx = order[indptr[b]:indptr[b+1]]
+        yield rasterize(x[idx] - b * strip, y[idx], cells[idx], colortab,
+                        min(strip, width - b * strip), height,
+                        weights=None if weights is None else weights[idx],
+                        dtype=dtype)
+
+
+@njit(parallel=True, cache=True)
+def _rasterize_stack(img, x, y, layer, order, indptr):
+    for b in prange(len(indptr) - 1):
+        for k in range(indptr[b], indptr[b+1]):
+            i = order[k]
+            j = layer[i]
+            if j >= 0 and img[j, x[i], y[i]] < 65535:
+                img[j, x[i], y[i]] += 1
+
+
+def rasterize_barcodes(x, y, barcode_ids, barcodes=None, width=None,
+                       height=None, band=64):
+    """
+    Count the points of every barcode per pixel in one sweep over the
+    points (parallelized like `rasterize`, also raising a `ValueError`
+    for pixels outside of the image).
+
+    Result: `barcodes` (default: all occurring) and the stacked counts of
+    shape `(len(barcodes), width, height)` (uint16, saturating)
+    """
+    barcode_ids = np.asarray(barcode_ids)
+    if barcodes is None:
+        barcodes = np.unique(barcode_ids)
+    barcodes = np.asarray(barcodes)
+    width = x.max() + 1 if width is None else width
+    height = y.max() + 1 if height is None else height
+    check_pixels(x, y, width, height)
+    lookup = np.full(max(barcode_ids.max(), barcodes.max()) + 1, -1,
+                     dtype=np.int64)
+    lookup[barcodes] = np.arange(len(barcodes))
+    order, indptr = bucket_order(x, band, -(-width // band))
+    img = np.zeros((len(barcodes), width, height), dtype=np.uint16)
+    _rasterize_stack(img, x, y, lookup[barcode_ids], order, indptr)
+    return barcodes, img
+
+
+def save_images(imgs, fnames, cmap=None, quantile=0.999, threads=None):
+    """
+    Store the images `imgs` (each normalized to its `quantile` of the
+    non-zero pixels) as PNGs, encoded in parallel by `threads`
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def save(args):
+        img, fname = args
+        nz = img[img > 0]
+        vmax = np.quantile(nz, quantile) if len(nz) else 1
+        plt.imsave(fname, img, cmap=cmap, vmin=0, vmax=max(vmax, 1))
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(save, zip(imgs, fnames)))
+
+
 def generate_colortable(name='Set1') -> np.ndarray:
     """
     See "Qualitative colormaps"
@@ -26,6 +172,96 @@ def generate_colortable(name='Set1') -> np.ndarray:
     return colortab
 
 
+def downsample(img: np.ndarray) -> np.ndarray:
+    """Average 2x2 blocks of pixels (odd sizes are padded by zeros)"""
+    w, h = img.shape[:2]
+    if w % 2 or h % 2:
+        img = np.pad(img, [(0, w % 2), (0, h % 2)] + [(0, 0)] * (img.ndim - 2))
+    s = img.reshape((img.shape[0] // 2, 2, img.shape[1] // 2, 2) +
+                    img.shape[2:]).sum(axis=(1, 3), dtype=np.float32)
+    return (s / 4).astype(img.dtype)
+
+
+class PyramidWriter:
+    """
+    Write an image as pyramid of `tile x tile` tiles: level `levels-1` is
+    the full resolution, every level above has half the resolution, and
+    level 0 is a single tile. Tile `(r, c)` of level `z` is stored as
+    `out_dir/z/r_c.png`.
+
+    The image is pushed in strips of rows (multiples of `tile`); each
+    level only buffers less than one row of tiles, which is completed
+    from the downsampled strips of the level below.
+    """
+
+    def __init__(self, out_dir: str, width: int, height: int,
+                 tile: int = 256):
+        import json
+        import os
+
+        assert tile % 2 == 0
+        self.out_dir, self.tile = out_dir, tile
+        self.levels = 1
+        while max(width, height) > tile << (self.levels - 1):
+            self.levels += 1
+        self.bufs = [None] * self.levels
+        self.rows = [0] * self.levels
+        for z in range(self.levels):
+            os.makedirs(path.join(out_dir, str(z)), exist_ok=True)
+        with open(path.join(out_dir, 'pyramid.json'), 'w') as io:
+            json.dump(dict(width=int(width), height=int(height), tile=tile,
+                           levels=self.levels), io)
+
+    def _write(self, z: int, rows: np.ndarray):
+        t = self.tile
+        for r in range(0, len(rows), t):
+            for c in range(0, rows.shape[1], t):
+                fname = path.join(self.out_dir, str(z),
+                                  f'{self.rows[z]}_{c // t}.png')
+                plt.imsave(fname, rows[r:r+t, c:c+t], vmin=0, vmax=1.0)
+            self.rows[z] += 1
+
+    def push(self, strip: np.ndarray, z: int = None):
+        """Append the next rows `strip` to level `z` (default: finest)"""
+        z = self.levels - 1 if z is None else z
+        buf = strip if self.bufs[z] is None else \
+            np.concatenate([self.bufs[z], strip])
+        n = len(buf) // self.tile * self.tile
+        self.bufs[z] = buf[n:]
+        if n > 0:
+            self._write(z, buf[:n])
+            if z > 0:
+                self.push(downsample(buf[:n]), z - 1)
+
+    def finish(self):
+        """Write the remaining (partial) rows of tiles of all levels"""
+        for z in reversed(range(self.levels)):
+            rest, self.bufs[z] = self.bufs[z], None
+            if rest is not None and len(rest) > 0:
+                self._write(z, rest)
+                if z > 0:
+                    self.push(downsample(rest), z - 1)
+
+
+def write_pyramid(img, out_dir: str, tile: int = 256, width: int = None,
+                  height: int = None) -> int:
+    """
+    Store `img` as tile pyramid (see `PyramidWriter`); returns #levels.
+    `img` is either a whole image or an iterator over its strips of
+    `tile` rows (of an image of size `width x height`, e.g. from
+    `rasterize_strips`), such that the full image is never in memory.
+    """
+    strips = img
+    if isinstance(img, np.ndarray):
+        width, height = img.shape[:2]
+        strips = (img[i:i+tile] for i in range(0, len(img), tile))
+    writer = PyramidWriter(out_dir, width, height, tile=tile)
+    for strip in strips:
+        writer.push(strip)
+    writer.finish()
+    return writer.levels
+
+
 def quantize_coordinates(coords, mpp, verbose=True):
     min_x, min_y = coords.min(axis=0)
     max_x, max_y = coords.max(axis=0)
@@ -52,9 +288,20 @@ if __name__ == '__main__':
     p.add_argument('fname', nargs='*', default=[_test_file_name()])
     p.add_argument('-p', '--microns-per-pixel', type=float, default=2)
     p.add_argument('-t', '--threshold-percentile', type=float, default=0.01)
-    p.add_argument('-b', '--barcode', type=int, default=2)
+    p.add_argument('-b', '--barcode', type=int, nargs='*', default=None,
+                   help='Barcodes of the atlas (default: all)')
+    p.add_argument('-A', '--atlas', action='store_true',
+                   help='Write one image barcode_<id>.png per barcode')
+    p.add_argument('-C', '--cmap', type=str, default='inferno')
     p.add_argument('-a', '--alpha', type=float, default=0.25)
     p.add_argument('-s', '--show', action='store_true')
+    p.add_argument('-B', '--bbox', type=float, nargs=4, default=None,
+                   metavar=('XMIN', 'XMAX', 'YMIN', 'YMAX'),
+                   help='Only render the points inside the box [µm]')
+    p.add_argument('-P', '--pyramid', action='store_true',
+                   help='Write a directory of tiles at all zoom levels')
+    p.add_argument('-T', '--tile', type=int, default=256,
+                   help='Tile size of the pyramid [pixels]')
     args = p.parse_args()
 
     mpp = args.microns_per_pixel
@@ -62,7 +309,8 @@ if __name__ == '__main__':
 
     for fname in args.fname:
         out = path.basename(fname) + '.png'
-        a = load_merfish(fname)
+        a = load_merfish(fname) if args.bbox is None else \
+            query_bbox(fname, *args.bbox)
         coords = a['abs_position']
         x, y = quantize_coordinates(coords, mpp)
         width, height = x.max()+1, y.max()+1
@@ -72,12 +320,32 @@ if __name__ == '__main__':
         v = np.minimum(a['total_magnitude'] / vmax, 1.0)
 
         colortab = generate_colortable() * args.alpha
-        cells = np.mod(a['cellID'], len(colortab))
-        v4 = colortab[cells]
+
+        if args.atlas:
+            print(f'Filling barcode images {width}x{height}')
+            barcodes, imgs = rasterize_barcodes(
+                x, y, a['barcode_id'], barcodes=args.barcode,
+                width=width, height=height)
+            save_images(imgs, [f'barcode_{b:03d}.png' for b in barcodes],
+                        cmap=args.cmap)
+            print(f'Saved {len(barcodes)} barcode images')
+            continue
+
+        if args.pyramid:
+            print(f'Filling image {width}x{height} in strips')
+            out = path.basename(fname) + '.tiles'
+            strips = rasterize_strips(x, y, np.asarray(a['cellID']),
+                                      colortab, width, height,
+                                      strip=args.tile)
+            levels = write_pyramid((np.minimum(s, 1.0) for s in strips),
+                                   out, tile=args.tile, width=width,
+                                   height=height)
+            print(f'Saved {levels} levels to "{out}"')
+            continue
 
         print(f'Filling image {width}x{height}')
-        img = np.zeros((width, height, v4.shape[-1]), dtype=float)
-        fill_img(img, x, y, v4)
+        img = rasterize(x, y, np.asarray(a['cellID']), colortab,
+                        width, height)
         img = np.minimum(img, 1.0)
 
         if args.show:
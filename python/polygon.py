@@ -3,31 +3,52 @@ How to plot polygons or a triangulation quickly in `matplotlib`
 """
 import matplotlib.pyplot as plt
 import numpy as np
-from numba import njit
+from numba import njit, prange
 
 from data import _test_file_name
 from reader import load_merfish
+from img import bucket_order, check_pixels, quantize_coordinates, \
+    generate_colortable
 
 
-def fill_exlusive(img, x, y, cell, full=-2, empty=-1):
-    @njit
-    def _fill(img, x, y, cell, full, empty):
-        for i, (xi, yi) in enumerate(zip(x, y)):
+@njit(parallel=True, cache=True)
+def _fill_exclusive(img, x, y, cell, order, indptr, full, empty):
+    for b in prange(len(indptr) - 1):
+        for k in range(indptr[b], indptr[b+1]):
+            i = order[k]
+            xi, yi = x[i], y[i]
             ci = cell[i]
             if not (img[xi, yi] == empty or img[xi, yi] == ci):
                 ci = full
             img[xi, yi] = ci
 
-    img = empty
-    _fill(img, x, y, cell, full, empty)
+
+def fill_exclusive(img, x, y, cell, full=-2, empty=-1, band=64):
+    """
+    Label every pixel `(x, y)` of the integer image `img` by the cell
+    owning it: the `cell` of all its points, `full` if points of
+    different cells fall into it and `empty` if there are none.
+    Pixels outside of `img` raise a `ValueError`.
+    """
+    check_pixels(x, y, *img.shape[:2])
+    img[:] = empty
+    order, indptr = bucket_order(x, band, -(-img.shape[0] // band))
+    _fill_exclusive(img, x, y, cell, order, indptr, full, empty)
     return img
 
 
+def cell_pixels(img, minlength=0):
+    """Number of pixels owned by every cell (labels `>= 0` of `img`)"""
+    labels = img[img >= 0]
+    return np.bincount(labels, minlength=minlength)
+
+
 if __name__ == '__main__':
     import argparse
 
     p = argparse.ArgumentParser(description=__doc__)
     p.add_argument('fname', type=str, default=None, nargs='?')
+    p.add_argument('-p', '--microns-per-pixel', type=float, default=3.0)
     args = p.parse_args()
 
     fname = _test_file_name() if args.fname is None else args.fname
@@ -47,21 +68,27 @@ if __name__ == '__main__':
     # tri = matplotlib.tri.Triangulation(coords[:, 0], coords[:, 1])
 
 
-    from img import quantize_coordinates, fill_img, generate_colortable
-    x, y = quantize_coordinates(coords, 3.0)
+    x, y = quantize_coordinates(coords, args.microns_per_pixel)
     width, height = x.max()+1, y.max()+1
 
-    colortab = generate_colortable() * color_alpha
-    cells_c = np.mod(cells, len(colortab))
-    v4 = colortab[cells_c]
-    img = np.zeros((width, height, v4.shape[-1]), dtype=float)
-    fill_img(img, x, y, v4)
-    img = np.minimum(img, 1.0)
-    npixels = (img > 0).any(axis=-1).sum()
+    full, empty = -2, -1
+    img = np.empty((width, height), dtype=np.int64)
+    fill_exclusive(img, x, y, cells, full=full, empty=empty)
+    npixels = (img != empty).sum()
     print(f'Reduction from {len(x):,d} to {npixels:,d}')
-    if False:
-        mask = (img > 0).any(axis=-1)
-        xeff, yeff = np.where(mask)
+    print(f'{(img == full).sum():,d} pixels with more than one cell')
+    counts = cell_pixels(img)
+    owning = counts > 0
+    if owning.any():
+        print(f'{owning.sum():,d} cells own {counts[owning].mean():.1f}',
+              'pixels on average')
+    else:
+        print('No cell owns a pixel')
+
+    colortab = generate_colortable() * color_alpha
+    rgba = colortab[np.mod(img, len(colortab))]
+    rgba[img == empty] = 0
+    rgba[img == full] = (0, 0, 0, 1)
 
-    plt.imshow(img, interpolation='none')
+    plt.imshow(rgba, interpolation='none')
     plt.show()
@@ -2,8 +2,12 @@
 Read merfish binary file information
 """
 import re
+import struct
 import sys
-from typing import List, IO
+from copy import deepcopy
+from functools import lru_cache
+from os import path, stat
+from typing import Dict, Iterator, List, IO, Union
 
 import numpy as np
 import pandas as pd
@@ -23,20 +27,34 @@ def sizeof_int(typ: str) -> int:
     return n // 8
 
 
+_CTYPES = {'single': np.float32,
+           'float': np.float32,
+           'double': np.float64,
+           'char': np.int8,
+           'bool': np.bool_}
+
+
+@lru_cache(maxsize=None)
+def dtype_typ(c: str) -> np.dtype:
+    """
+    Create a corresponding np.dtype to `c`
+
+    >>> dtype_typ("single")
+    dtype('float32')
+    """
+    if c in _CTYPES:
+        return np.dtype(_CTYPES[c])
+    if 'int' in c:
+        return np.dtype(c)
+    raise NotImplementedError(c)
+
+
 def sizeof_type(typ: str) -> int:
     """
     >>> sizeof_type("double")
     8
     """
-    sizes = {'single': 4,
-             'float': 4,
-             'double': 8,
-             'char': 1}
-    if typ in sizes:
-        return sizes[typ]
-    if 'int' in typ:
-        return sizeof_int(typ)
-    raise NotImplementedError(typ)
+    return dtype_typ(typ).itemsize
 
 
 def sizeof_file(fname: str) -> int:
@@ -48,15 +66,6 @@ def sizeof_file(fname: str) -> int:
     return stat(fname).st_size
 
 
-def dtype_typ(c: str):
-    """
-    Create a corresponding np.dtype to `c`
-    """
-    if c == 'float':
-        return np.float32
-    return eval('np.' + c)
-
-
 def fread(io: IO, typ: str, byteorder=sys.byteorder):
     """
     Read from (buffered) IO reader in the c type typ, eg
@@ -71,6 +80,20 @@ def fread(io: IO, typ: str, byteorder=sys.byteorder):
         raise NotImplementedError(f"Don't know how to read '{typ}'")
 
 
+def fwrite(io: IO, typ: str, val, byteorder=sys.byteorder):
+    """
+    Write `val` as c type `typ` to the (buffered) IO writer (see `fread`)
+    """
+    if typ == "bool":
+        io.write(bool(val).to_bytes(1, byteorder))
+    elif "int" in typ:
+        signed = typ[0] != "u"
+        size = sizeof_int(typ)
+        io.write(int(val).to_bytes(size, byteorder, signed=signed))
+    else:
+        raise NotImplementedError(f"Don't know how to write '{typ}'")
+
+
 class RecordDef:
     """Layout definition of a merfish record"""
     fields: List[str]
@@ -107,49 +130,182 @@ class RecordDef:
                   file=out)
         print(f"}};   /* sizeof({name}) == {self.sizeof()} */", file=out)
 
-    def to_dtype(self):
-        return np.dtype([(d, dtype_typ(c), f) for d, f, c in self])
+    def to_dtype(self) -> np.dtype:
+        return _layout_dtype(tuple(self))
+
+    def to_str(self) -> str:
+        """Layout string as stored in the header (inverse of `read_header`)"""
+        return ','.join(f"{d},1 {f},{c if c != 'float' else 'single'}"
+                        for d, f, c in self)
+
+    @staticmethod
+    def from_dtype(dtype: np.dtype) -> 'RecordDef':
+        """Layout of a structured numpy dtype (inverse of `to_dtype`)"""
+        layout = RecordDef()
+        layout.fields = list(dtype.names)
+        layout.lens = []
+        layout.ctype = []
+        for d in layout.fields:
+            sub = dtype.fields[d][0]
+            base = sub.base if sub.shape else sub
+            layout.lens.append(int(np.prod(sub.shape)) if sub.shape else 1)
+            layout.ctype.append('float' if base == np.float32 else
+                                'double' if base == np.float64 else
+                                base.name)
+        return layout
+
+
+COLUMN_ALIGN = 64
+
+
+def _align(n: int, align: int = COLUMN_ALIGN) -> int:
+    return -(-n // align) * align
+
+
+@lru_cache(maxsize=64)
+def _layout_dtype(layout) -> np.dtype:
+    # scalar fields have to be of shape `()`, not `(1,)`
+    return np.dtype([(d, dtype_typ(c), f if f > 1 else ())
+                     for d, f, c in layout])
 
 
 class Header:
-    """Binary merfish header"""
+    """
+    Binary merfish header.
+
+    Version 2 files store the records sorted by `(cellID, barcode_id)`;
+    right after the layout string follow `num_cells` (uint32) and the
+    cell ranges `indptr` (`num_cells + 1` times uint64) starting at
+    `indptr_offset`, such that cell `c` is `records[indptr[c]:indptr[c+1]]`.
+
+    Version 3 files are columnar: starting at `offset`, every field is
+    stored as one contiguous array, each of them aligned to `COLUMN_ALIGN`
+    bytes (see `column_offsets`).
+    """
     version: int = -1
     is_corrupt: bool = True
     num_entries: int = -1
     header_len: int = -1
     offset: int = -1
     layout: RecordDef = RecordDef()
+    num_cells: int = -1
+    indptr_offset: int = -1
+
+
+_HEADER_START = struct.Struct('=B?II')
 
 
-def read_header(fname: str, check_file_size=True) -> Header:
+def read_header(fname: str, check_file_size=True,
+                read_size: int = 4096) -> Header:
     """
     Read merfish binary header information.
-    Usually that are the first 439 bytes.
+    Usually that are the first 439 bytes, read at once as part of the
+    first `read_size` bytes (the rest is read when needed).
+
+    Headers are cached per path, size and modification time, so opening
+    the same file again does not touch the disk; every call returns its
+    own (deep) copy.
     """
-    h = Header()
+    st = stat(fname)
+    h = deepcopy(_read_header(path.abspath(fname), st.st_size,
+                              st.st_mtime_ns, read_size))
+    if check_file_size:
+        if h.version == 3:
+            last = h.layout.fields[-1]
+            a = _align(column_offsets(h)[last] +
+                       h.num_entries * h.layout.to_dtype()[last].itemsize)
+        else:
+            a = h.offset + h.layout.sizeof() * h.num_entries
+        assert a == st.st_size, f"{a} != {st.st_size} in {fname}"
+    return h
+
+
+@lru_cache(maxsize=128)
+def _read_header(fname: str, size: int, mtime_ns: int,
+                 read_size: int = 4096) -> Header:
+    """Parse the header from (usually) a single read of `read_size` bytes"""
     with open(fname, 'rb') as io:
-        h.version = fread(io, "uint8")
-        assert h.version == 1
-        h.is_corrupt = fread(io, "bool")
+        buf = io.read(max(read_size, _HEADER_START.size))
+        h = Header()
+        h.layout = RecordDef()
+        h.version, h.is_corrupt, h.num_entries, h.header_len = \
+            _HEADER_START.unpack_from(buf)
+        assert h.version in (1, 2, 3), f"unknown version {h.version}"
         assert not h.is_corrupt
-        h.num_entries = fread(io, "uint32")
-        h.header_len = fread(io, "uint32")
-        layout_str = io.read(h.header_len).decode()
-        h.offset = io.tell()
+        start = _HEADER_START.size
+        end = start + h.header_len + (4 if h.version == 2 else 0)
+        if len(buf) < end:
+            buf += io.read(end - len(buf))
+    layout_str = buf[start:start + h.header_len].decode()
+    h.offset = start + h.header_len
+    if h.version == 2:
+        h.num_cells, = struct.unpack_from('=I', buf, h.offset)
+        h.indptr_offset = h.offset + 4
+        h.offset = h.indptr_offset + 8 * (h.num_cells + 1)
+    if h.version == 3:
+        h.offset = _align(h.offset)
     layout = layout_str.split(',')
     ctype = layout[2::3]
     h.layout.ctype = [s if s != 'single' else 'float' for s in ctype]
     h.layout.fields = layout[::3]
-    h.layout.lens = [int(s.split(' ')[-1]) for s in layout[1::3]]
-    if check_file_size:
-        sizeof_record = h.layout.sizeof()
-        a = h.offset + sizeof_record * h.num_entries
-        b = sizeof_file(fname)
-        assert a == b, f"{a} != {b} in {fname}"
+    h.layout.lens = [int(s.rsplit(' ', 1)[-1]) for s in layout[1::3]]
     return h
 
 
-def load_merfish(fname: str) -> np.memmap:
+def column_offsets(h: Header) -> Dict[str, int]:
+    """Byte offset of every column in a columnar (version 3) file"""
+    dtype = h.layout.to_dtype()
+    offsets = {}
+    offset = h.offset
+    for d in h.layout.fields:
+        offsets[d] = offset
+        offset = _align(offset + h.num_entries * dtype[d].itemsize)
+    return offsets
+
+
+class Columns:
+    """
+    Lazy access to a columnar (version 3) file:
+    `obj['field']` memory-maps only that column, whereas a list of fields
+    or a row index gives a (structured) array like `load_merfish` would.
+    """
+
+    def __init__(self, fname: str, h: Header = None):
+        self.fname = fname
+        self.header = read_header(fname) if h is None else h
+        self.dtype = self.header.layout.to_dtype()
+        self.offsets = column_offsets(self.header)
+
+    def __len__(self) -> int:
+        return self.header.num_entries
+
+    @property
+    def shape(self):
+        return (len(self),)
+
+    def column(self, field: str) -> np.memmap:
+        sub = self.dtype[field]
+        return np.memmap(self.fname, mode='r', offset=self.offsets[field],
+                         dtype=sub.base, shape=(len(self),) + sub.shape)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.column(key)
+        if isinstance(key, list) and all(isinstance(k, str) for k in key):
+            out = np.empty(len(self), dtype=[(k, self.dtype[k]) for k in key])
+            for k in key:
+                out[k] = self.column(k)
+            return out
+        if isinstance(key, (int, np.integer)):
+            return self[[key]][0]
+        cols = [self.column(k)[key] for k in self.dtype.names]
+        out = np.empty(len(cols[0]), dtype=self.dtype)
+        for k, c in zip(self.dtype.names, cols):
+            out[k] = c
+        return out
+
+
+def load_merfish(fname: str) -> Union[np.memmap, Columns]:
     """
     Return memory-mapped file access that can be treated as a numpy array.
     Usually you want to slice some of the elements and create a new array
@@ -160,12 +316,372 @@ def load_merfish(fname: str) -> np.memmap:
 
     A full description of all columns can be obtained via
     `load_merfish("bla.bin").dtype.fields`.
+
+    Columnar files (version 3) are returned as lazy `Columns`.
     """
     h = read_header(fname)
+    if h.version == 3:
+        return Columns(fname, h)
     array = np.memmap(fname, offset=h.offset, dtype=h.layout.to_dtype())
     return array
 
 
+def _madvise(a: np.ndarray, advice: int, start: int = 0, stop: int = None):
+    """
+    Give the kernel the `advice` (e.g. `mmap.MADV_SEQUENTIAL`) for the rows
+    `start:stop` of the memmap `a` (silently ignored where not supported).
+    """
+    import mmap
+
+    mm = getattr(a, '_mmap', None)
+    if mm is None or not hasattr(mm, 'madvise') or len(a) == 0:
+        return
+    base = np.frombuffer(mm, dtype=np.uint8).ctypes.data
+    stop = len(a) if stop is None else min(stop, len(a))
+    begin = a.ctypes.data - base + start * a.strides[0]
+    end = min(a.ctypes.data - base + stop * a.strides[0], len(mm))
+    begin -= begin % mmap.PAGESIZE
+    if end > begin:
+        mm.madvise(advice, begin, end - begin)
+
+
+def iter_chunks(fname: str, fields: List[str] = None,
+                chunk_records: int = 1 << 20, sequential=True,
+                readahead=True, start: int = 0,
+                stop: int = None) -> Iterator[np.ndarray]:
+    """
+    Iterate over the records `start:stop` (default: all) of the file in
+    contiguous chunks of (at most) `chunk_records` records, each of them a
+    structured array having only the `fields` (default: all), i.e. memory
+    usage is bounded by the chunk size.
+
+    With `sequential`, the kernel is told that the file is read in order
+    (`madvise(MADV_SEQUENTIAL)`); with `readahead`, the pages of the next
+    chunk are requested (`MADV_WILLNEED`) before a chunk is handed out.
+    """
+    import mmap
+
+    array = load_merfish(fname)
+    if fields is None:
+        fields = list(array.dtype.names)
+    dtype = np.dtype([(d, array.dtype[d]) for d in fields])
+    cols = {d: array[d] for d in fields}
+    if isinstance(array, Columns):
+        maps = list(cols.values())
+    else:
+        maps = [array]
+    n = len(array) if stop is None else min(stop, len(array))
+    if sequential and hasattr(mmap, 'MADV_SEQUENTIAL'):
+        for m in maps:
+            _madvise(m, mmap.MADV_SEQUENTIAL, start, n)
+    for i in range(start, n, chunk_records):
+        j = min(i + chunk_records, n)
+        if readahead and hasattr(mmap, 'MADV_WILLNEED'):
+            for m in maps:
+                _madvise(m, mmap.MADV_WILLNEED, j,
+                         min(j + chunk_records, n))
+        chunk = np.empty(j - i, dtype=dtype)
+        for d, col in cols.items():
+            chunk[d] = col[i:j]
+        yield chunk
+
+
+def write_header(io: IO, layout: RecordDef, num_entries: int,
+                 indptr: np.ndarray = None, version: int = None):
+    """
+    Write a merfish header to `io`.
+    If the cell ranges `indptr` are given, the header is of version 2
+    (see `Header`).
+    """
+    if version is None:
+        version = 1 if indptr is None else 2
+    assert (version == 2) == (indptr is not None)
+    layout_str = layout.to_str().encode()
+    fwrite(io, "uint8", version)
+    fwrite(io, "bool", False)
+    fwrite(io, "uint32", num_entries)
+    fwrite(io, "uint32", len(layout_str))
+    io.write(layout_str)
+    if indptr is not None:
+        fwrite(io, "uint32", len(indptr) - 1)
+        io.write(np.asarray(indptr, dtype=np.uint64).tobytes())
+
+
+def write_merfish(fname: str, array: np.ndarray, indptr: np.ndarray = None,
+                  order: np.ndarray = None, chunk_records: int = 1 << 20):
+    """
+    Store the structured `array` (in the permutation `order`, if given)
+    as merfish binary in `fname`.
+    Records are copied in chunks of `chunk_records` so that `array` may
+    also be a memmap of a file larger than the main memory.
+    """
+    n = len(array) if order is None else len(order)
+    with open(fname, 'wb') as io:
+        write_header(io, RecordDef.from_dtype(array.dtype), n, indptr=indptr)
+        for i in range(0, n, chunk_records):
+            chunk = array[i:i+chunk_records] if order is None else \
+                array[order[i:i+chunk_records]]
+            io.write(np.ascontiguousarray(chunk).tobytes())
+
+
+def load_indptr(fname: str, h: Header = None) -> np.ndarray:
+    """Cell ranges of a version 2 file (see `Header`)"""
+    if h is None:
+        h = read_header(fname)
+    assert h.version == 2, f"{fname} is not sorted by cells (version 2)"
+    with open(fname, 'rb') as io:
+        io.seek(h.indptr_offset)
+        return np.fromfile(io, dtype=np.uint64, count=h.num_cells + 1)
+
+
+def sort_merfish(fname: str, out: str, chunk_records: int = 1 << 20):
+    """
+    Convert `fname` into a version 2 file `out`, i.e. sort the records by
+    `(cellID, barcode_id)` and store the cell ranges.
+    """
+    array = load_merfish(fname)
+    cell_ids = np.array(array['cellID'])
+    order = np.lexsort((array['barcode_id'], cell_ids))
+    indptr = np.zeros(int(cell_ids.max()) + 2, dtype=np.uint64)
+    np.cumsum(np.bincount(cell_ids), out=indptr[1:])
+    del cell_ids
+    write_merfish(out, array, indptr=indptr, order=order,
+                  chunk_records=chunk_records)
+
+
+def write_columnar(fname: str, out: str, chunk_records: int = 1 << 20):
+    """
+    Convert `fname` into a columnar (version 3) file `out`.
+    The input is read only once, in chunks of `chunk_records`.
+    """
+    array = load_merfish(fname)
+    layout = RecordDef.from_dtype(array.dtype)
+    with open(out, 'wb') as io:
+        write_header(io, layout, len(array), version=3)
+    h = read_header(out, check_file_size=False)
+    offsets = column_offsets(h)
+    last = layout.fields[-1]
+    with open(out, 'r+b') as io:
+        io.truncate(_align(offsets[last] +
+                           len(array) * array.dtype[last].itemsize))
+    cols = {d: np.memmap(out, mode='r+', offset=offsets[d],
+                         dtype=array.dtype[d].base,
+                         shape=(len(array),) + array.dtype[d].shape)
+            for d in layout.fields}
+    for i in range(0, len(array), chunk_records):
+        chunk = array[i:i+chunk_records]
+        for d, col in cols.items():
+            col[i:i+chunk_records] = chunk[d]
+    for col in cols.values():
+        col.flush()
+
+
+def cache_key(fname: str, version: int = 1) -> np.ndarray:
+    """
+    Identify the content of `fname` by its size, modification time and
+    a hash of the header (and the `version` of the derived product)
+    """
+    import hashlib
+
+    h = read_header(fname)
+    with open(fname, 'rb') as io:
+        digest = hashlib.sha1(io.read(h.offset)).digest()
+    st = stat(fname)
+    return np.array([version, st.st_size, st.st_mtime_ns,
+                     int.from_bytes(digest[:8], 'little', signed=True)],
+                    dtype=np.int64)
+
+
+def _load_sidecar(prefix: str, key: np.ndarray,
+                  mapped=('order', 'indptr')) -> Dict[str, np.ndarray]:
+    """
+    Arrays of the sidecar `prefix` if it exists and was stored with `key`:
+    the small ones from `prefix + '.npz'`, the `mapped` ones memory-mapped
+    from `prefix + '.<name>.npy'` (so only the pages used are read)
+    """
+    if not path.exists(prefix + '.npz'):
+        return None
+    with np.load(prefix + '.npz') as z:
+        if not np.array_equal(z['key'], key):
+            return None
+        arrays = dict(z)
+    try:
+        for name in mapped:
+            arrays[name] = np.load(f'{prefix}.{name}.npy', mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    return arrays
+
+
+def _save_sidecar(prefix: str, key: np.ndarray,
+                  mapped: Dict[str, np.ndarray], **arrays):
+    """
+    Store the `mapped` arrays as `.npy` files and then (so the sidecar is
+    only valid once complete) `key` and the small `arrays` in
+    `prefix + '.npz'`
+    """
+    try:
+        for name, a in mapped.items():
+            np.save(f'{prefix}.{name}.npy', a)
+        with open(prefix + '.npz', 'wb') as io:
+            np.savez(io, key=key, **arrays)
+    except OSError as e:
+        print(f'Could not write index "{prefix}": {e}', file=sys.stderr)
+
+
+class CellIndex:
+    """
+    Index of the records of every cell for files that are not sorted by
+    cells. It is built once (one stable argsort of the cellIDs) and stored
+    in the sidecar files `index_fname + '.{npz,order.npy,indptr.npy}'`
+    (default: `fname + '.cellidx'`), from where `order` and `indptr` are
+    memory-mapped. Record positions of cell `c` are
+    `order[indptr[c]:indptr[c+1]]`.
+    """
+
+    def __init__(self, fname: str, cache=True, index_fname: str = None):
+        self.records = load_merfish(fname)
+        if index_fname is None:
+            index_fname = fname + '.cellidx'
+        key = cache_key(fname) if cache else None
+        z = _load_sidecar(index_fname, key) if cache else None
+        if z is not None:
+            self.order, self.indptr = z['order'], z['indptr']
+            return
+        cell_ids = np.array(self.records['cellID'])
+        self.order = np.argsort(cell_ids, kind='stable').astype(np.uint32)
+        self.indptr = np.zeros(int(cell_ids.max()) + 2, dtype=np.int64)
+        np.cumsum(np.bincount(cell_ids), out=self.indptr[1:])
+        if cache:
+            _save_sidecar(index_fname, key, dict(order=self.order,
+                                                 indptr=self.indptr))
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def __getitem__(self, cell_id: int) -> np.ndarray:
+        """Record positions of cell `cell_id` (in file order)"""
+        if not 0 <= cell_id < len(self):
+            return self.order[:0]
+        return self.order[self.indptr[cell_id]:self.indptr[cell_id+1]]
+
+    def cells(self, cell_ids) -> np.ndarray:
+        """Records of several cells, in the order of `cell_ids`"""
+        pos = np.concatenate([self[int(c)] for c in cell_ids] +
+                             [self.order[:0]])
+        return self.records[pos]
+
+
+class SpatialIndex:
+    """
+    Grid of square tiles (side length `tile` in µm) over `abs_position`.
+    The record positions in tile `t = j*nx + i` (i.e. the points with
+    `x0 + i*tile <= x < x0 + (i+1)*tile` and likewise for y) are
+    `order[indptr[t]:indptr[t+1]]`, sorted in file order.
+    Like `CellIndex`, it is stored in sidecar files (default prefix:
+    `fname + '.tiles'`) and `order`/`indptr` are memory-mapped, so a query
+    only reads the pages of the tiles it touches.
+    """
+
+    def __init__(self, fname: str, tile: float = 50.0, cache=True,
+                 index_fname: str = None):
+        self.records = load_merfish(fname)
+        if index_fname is None:
+            index_fname = fname + '.tiles'
+        key = np.append(cache_key(fname), np.float64(tile).view(np.int64)) \
+            if cache else None
+        z = _load_sidecar(index_fname, key) if cache else None
+        if z is not None:
+            self.order, self.indptr = z['order'], z['indptr']
+            (self.x0, self.y0), self.tile = z['origin'], tile
+            self.nx, self.ny = (int(n) for n in z['shape'])
+            return
+        pos = np.array(self.records['abs_position'])
+        self.tile = tile
+        self.x0, self.y0 = pos.min(axis=0)
+        self.nx, self.ny = (int(n) for n in
+                            (pos.max(axis=0) - (self.x0, self.y0)) // tile + 1)
+        tiles = self._tile_of(pos[:, 0], pos[:, 1])
+        del pos
+        self.order = np.argsort(tiles, kind='stable').astype(np.uint32)
+        self.indptr = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tiles, minlength=self.nx * self.ny),
+                  out=self.indptr[1:])
+        if cache:
+            _save_sidecar(index_fname, key, dict(order=self.order,
+                                                 indptr=self.indptr),
+                          origin=np.array([self.x0, self.y0]),
+                          shape=np.array([self.nx, self.ny]))
+
+    def _tile_of(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        i = np.clip((x - self.x0) // self.tile, 0, self.nx - 1)
+        j = np.clip((y - self.y0) // self.tile, 0, self.ny - 1)
+        return j.astype(np.int64) * self.nx + i.astype(np.int64)
+
+    def positions(self, xmin: float, xmax: float, ymin: float,
+                  ymax: float) -> np.ndarray:
+        """
+        Positions of the records in all tiles touching the box
+        (i.e. a superset of the records inside), in file order
+        """
+        def tile_range(lo, hi, origin, n):
+            r = np.clip([(lo - origin) // self.tile,
+                         (hi - origin) // self.tile], 0, n - 1)
+            return int(r[0]), int(r[1])
+
+        i0, i1 = tile_range(xmin, xmax, self.x0, self.nx)
+        j0, j1 = tile_range(ymin, ymax, self.y0, self.ny)
+        rows = [self.order[self.indptr[j*self.nx + i0]:
+                           self.indptr[j*self.nx + i1 + 1]]
+                for j in range(j0, j1 + 1)]
+        return np.sort(np.concatenate(rows + [self.order[:0]]))
+
+    def query(self, xmin: float, xmax: float, ymin: float,
+              ymax: float) -> np.ndarray:
+        """Records with `xmin <= x <= xmax` and `ymin <= y <= ymax`"""
+        a = self.records[self.positions(xmin, xmax, ymin, ymax)]
+        x, y = a['abs_position'].T
+        return a[(xmin <= x) & (x <= xmax) & (ymin <= y) & (y <= ymax)]
+
+
+def query_bbox(fname: str, xmin: float, xmax: float, ymin: float,
+               ymax: float, tile: float = 50.0) -> np.ndarray:
+    """
+    Records of `fname` inside the box `[xmin, xmax] x [ymin, ymax]`
+    (of `abs_position`), read via the `SpatialIndex`
+    """
+    return SpatialIndex(fname, tile=tile).query(xmin, xmax, ymin, ymax)
+
+
+class CellSorted:
+    """
+    Records of a version 2 file, accessible by cell, e.g.
+    ```
+    cells = CellSorted("bla.v2.bin")
+    cells[13]['abs_position']
+    ```
+    """
+
+    def __init__(self, fname: str):
+        self.header = read_header(fname)
+        self.records = load_merfish(fname)
+        self.indptr = load_indptr(fname, self.header)
+
+    def __len__(self) -> int:
+        return self.header.num_cells
+
+    def __getitem__(self, cell_id: int) -> np.memmap:
+        """All records of cell `cell_id` (empty if there are none)"""
+        if not 0 <= cell_id < len(self):
+            return self.records[:0]
+        return self.records[int(self.indptr[cell_id]):
+                            int(self.indptr[cell_id+1])]
+
+    def cells(self, cell_ids) -> np.ndarray:
+        """Records of several cells, in the order of `cell_ids`"""
+        return np.concatenate([self[int(c)] for c in cell_ids])
+
+
 def read_codebook(fname: str) -> pd.DataFrame:
     return pd.read_csv(fname, skiprows=3, skipinitialspace=True,
                        dtype={'name': str, 'id': str},
@@ -177,8 +693,23 @@ if __name__ == '__main__':
 
     p = argparse.ArgumentParser(description="Print header informations")
     p.add_argument('fname', nargs='+')
+    p.add_argument('-S', '--sort', action='store_true',
+                   help='Convert to a cell sorted file (version 2)')
+    p.add_argument('-c', '--columnar', action='store_true',
+                   help='Convert to a columnar file (version 3)')
     args = p.parse_args()
 
     for fname in args.fname:
         h = read_header(fname, check_file_size=False)
+        print(f'version      {h.version}')
         print(f'num_entries  {h.num_entries:,d}')
+        if h.version == 2:
+            print(f'num_cells    {h.num_cells:,d}')
+        if args.sort:
+            out = path.basename(fname) + '.v2.bin'
+            print(f'sorting to "{out}"')
+            sort_merfish(fname, out)
+        if args.columnar:
+            out = path.basename(fname) + '.col.bin'
+            print(f'writing columns to "{out}"')
+            write_columnar(fname, out)
@@ -5,8 +5,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 from os.path import basename
 from data import _test_file_name
-from reader import load_merfish
-from utils import group_index, Status
+from aggregate import cell_aggregate
+from utils import Status
 from graph import delaunay_graph, plot_edges, euclidean_edge_length
 
 
@@ -21,33 +21,23 @@ if __name__ == '__main__':
     p.add_argument('-a', '--area-factor', type=float, default=0.01)
     p.add_argument('-l', '--logarithmic', action='store_true')
     p.add_argument('-e', '--eps', type=float, default=1.0)
+    p.add_argument('-n', '--no-cache', action='store_true',
+                   help='Do not use/write the cell aggregate cache')
     args = p.parse_args()
 
     fname = _test_file_name() if args.fname is None else args.fname
-    df = load_merfish(fname)
     plot_ranks = [2, 5, 4, 7, 10, 11]
 
-    with Status('Loading ' + basename(fname)):
-        a = np.array(df[['barcode_id', 'cellID', 'abs_position', 'area']])
+    with Status('Aggregating cells of ' + basename(fname)):
+        agg = cell_aggregate(fname, cache=not args.no_cache)
+        assert len(agg) < 1e5
+    print(f"#points = {agg.counts.sum():,d}")
+    print(f"#cells  = {len(agg):,d}")
 
-    with Status('Sorting cells'):
-        cell_order = np.argsort(a['cellID'])
-        a = a[cell_order]
-        cell_idx = group_index(a['cellID'])
-        assert len(cell_idx) < 1e5
-    print(f"#points = {len(a):,d}")
-    print(f"#cells  = {len(cell_idx):,d}")
-
-    def iter_cells(axis='abs_position'):
-        return np.split(a[axis], cell_idx[1:])
-
-    centers = np.array([p.mean(axis=0) for p in iter_cells()])
-    areas = np.array([p.sum() for p in iter_cells('area')])
-    max_barcode = a['barcode_id'].max()+1
-    gene_freq = np.zeros((len(cell_idx), max_barcode))
-    for i, p in enumerate(iter_cells('barcode_id')):
-        gene_freq[i, :] = np.bincount(p, minlength=gene_freq.shape[1]) / len(p)
-    total_freq = gene_freq.mean(axis=0)
+    centers = agg.centers
+    areas = agg.areas
+    gene_freq = agg.barcode_freq().tocsc()
+    total_freq = np.asarray(gene_freq.mean(axis=0)).ravel()
     barcode_rank = np.argsort(total_freq)
 
     if args.barcode_freq:
@@ -70,8 +60,8 @@ if __name__ == '__main__':
         for rank in plot_ranks:
             bid = barcode_rank[-rank]
             eps = args.eps
-            gene_color = np.log(gene_freq[:, bid] + eps) if log_scale \
-                else gene_freq[:, bid]
+            freq = gene_freq[:, [bid]].toarray().ravel()
+            gene_color = np.log(freq + eps) if log_scale else freq
 
             plt.figure(f"barcode {bid} frequency (rank {rank})")
             plt.scatter(*centers.T, c=gene_color, alpha=0.5, s=f*areas,
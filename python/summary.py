@@ -0,0 +1,177 @@
+"""
+Summary statistics (ranges, means, histograms) of merfish files,
+computed in one pass over chunks of the files using a process pool
+"""
+import os
+import numpy as np
+from typing import Dict, List
+from reader import load_merfish, iter_chunks
+
+
+RANGE_FIELDS = ['pixel_centroid', 'abs_position', 'weighted_pixel_centroid']
+MEAN_FIELDS = ['inNucleus']
+# (lo, hi, bins) per field; values outside of [lo, hi) are only counted
+HIST_RANGES = {'total_magnitude': (0.0, 1e4, 10000),
+               'distNucleus': (-250.0, 250.0, 5000),
+               'error_bit': (0, 17, 17),
+               'area': (0, 1000, 1000)}
+
+
+class Histogram:
+    """
+    Histogram with `bins` equal bins over the fixed range `[lo, hi)`;
+    values below/above are counted in `underflow`/`overflow` (NaNs are
+    dropped). Memory does not depend on the data, and histograms of
+    different chunks are merged by adding the counts.
+    """
+
+    def __init__(self, lo: float, hi: float, bins: int):
+        assert hi > lo and bins > 0
+        self.lo, self.hi = lo, hi
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def width(self) -> float:
+        return (self.hi - self.lo) / len(self.counts)
+
+    def add(self, x: np.ndarray):
+        x = np.asarray(x).ravel()
+        if x.dtype.kind == 'f':
+            x = x[~np.isnan(x)]
+        below, above = x < self.lo, x >= self.hi
+        self.underflow += int(below.sum())
+        self.overflow += int(above.sum())
+        x = x[~(below | above)]
+        k = np.floor((x - self.lo) / self.width).astype(np.int64)
+        bins = len(self.counts)
+        self.counts += np.bincount(np.minimum(k, bins - 1), minlength=bins)
+        return self
+
+    def merge(self, other: 'Histogram'):
+        assert (self.lo, self.hi, len(self.counts)) == \
+            (other.lo, other.hi, len(other.counts))
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    @property
+    def edges(self) -> np.ndarray:
+        return np.linspace(self.lo, self.hi, len(self.counts) + 1)
+
+    def trim1(self, cut: float) -> 'Histogram':
+        """
+        Drop the upper `cut` fraction of all values (like
+        `scipy.stats.trim1`), i.e. the overflow, the upper bins and
+        the empty bins above the remaining values
+        """
+        total = self.counts.sum() + self.underflow + self.overflow
+        cum = self.underflow + np.cumsum(self.counts)
+        nonzero, = np.nonzero(self.counts * (cum <= (1 - cut) * total))
+        keep = nonzero[-1] + 1 if len(nonzero) else 1
+        h = Histogram(self.lo, self.lo + keep * self.width, keep)
+        h.counts = self.counts[:keep].copy()
+        h.underflow = self.underflow
+        return h
+
+    def plot(self, ax=None, density=False, **kwargs):
+        import matplotlib.pyplot as plt
+
+        if ax is None:
+            ax = plt.gca()
+        counts = self.counts / (self.counts.sum() * self.width) if density \
+            else self.counts
+        ax.stairs(counts, self.edges, **kwargs)
+
+
+class Summary:
+    """Mergeable statistics of (a part of) a merfish file"""
+
+    def __init__(self, range_fields: List[str] = RANGE_FIELDS,
+                 mean_fields: List[str] = MEAN_FIELDS,
+                 hist_ranges: Dict[str, tuple] = HIST_RANGES):
+        self.n = 0
+        self.lo = {d: np.inf for d in range_fields}
+        self.hi = {d: -np.inf for d in range_fields}
+        self.sums = {d: 0.0 for d in mean_fields}
+        self.hists = {d: Histogram(*r) for d, r in hist_ranges.items()}
+
+    @property
+    def fields(self) -> List[str]:
+        return list(dict.fromkeys([*self.lo, *self.sums, *self.hists]))
+
+    def add(self, chunk):
+        """Account for all records of `chunk` (anything indexable by field)"""
+        for d in self.lo:
+            if len(chunk[d]) > 0:
+                self.lo[d] = np.minimum(self.lo[d], chunk[d].min(axis=0))
+                self.hi[d] = np.maximum(self.hi[d], chunk[d].max(axis=0))
+        for d in self.sums:
+            self.sums[d] += chunk[d].sum(dtype=np.float64)
+        for d, h in self.hists.items():
+            h.add(chunk[d])
+        self.n += len(chunk[self.fields[0]])
+        return self
+
+    def merge(self, other: 'Summary'):
+        self.n += other.n
+        for d in self.lo:
+            self.lo[d] = np.minimum(self.lo[d], other.lo[d])
+            self.hi[d] = np.maximum(self.hi[d], other.hi[d])
+        for d in self.sums:
+            self.sums[d] += other.sums[d]
+        for d, h in self.hists.items():
+            h.merge(other.hists[d])
+        return self
+
+    def mean(self, field: str) -> float:
+        return self.sums[field] / self.n
+
+
+def summarize_range(fname: str, start: int, stop: int,
+                    chunk_records: int = 1 << 20, **kwargs) -> Summary:
+    """Summary of the records `start:stop` of `fname`"""
+    s = Summary(**kwargs)
+    for chunk in iter_chunks(fname, s.fields, chunk_records=chunk_records,
+                             start=start, stop=stop):
+        s.add(chunk)
+    return s
+
+
+def _summarize_task(task):
+    fname, start, stop, chunk_records, kwargs = task
+    return fname, summarize_range(fname, start, stop,
+                                  chunk_records=chunk_records, **kwargs)
+
+
+def summarize(fnames: List[str], processes: int = None,
+              task_records: int = 1 << 23, chunk_records: int = 1 << 20,
+              **kwargs) -> Dict[str, Summary]:
+    """
+    Summaries of all files `fnames`.
+    Every file is split into ranges of `task_records` records which are
+    summarized in parallel by `processes` worker processes (default: all
+    cores, at most one per range; a single process runs in this process),
+    each range being scanned only once.
+    Workers are spawned (not forked), as forking a process that already
+    runs (numba) threads may deadlock.
+    """
+    from multiprocessing import get_context
+
+    tasks = []
+    for fname in fnames:
+        n = len(load_merfish(fname))
+        tasks += [(fname, i, min(i + task_records, n), chunk_records, kwargs)
+                  for i in range(0, n, task_records)]
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    if processes <= 1:
+        results = list(map(_summarize_task, tasks))
+    else:
+        with get_context('spawn').Pool(processes) as pool:
+            results = pool.map(_summarize_task, tasks)
+    summaries = {fname: Summary(**kwargs) for fname in fnames}
+    for fname, s in results:
+        summaries[fname].merge(s)
+    return summaries
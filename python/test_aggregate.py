@@ -0,0 +1,32 @@
+import numpy as np
+from aggregate import cell_aggregate, compute_aggregate
+
+
+def test_compute_aggregate(random_records, merfish_file):
+    a = random_records(2000, num_cells=50)
+    a['cellID'][a['cellID'] == 7] = 8
+    fname, _ = merfish_file(a)
+    agg = compute_aggregate(fname, chunk_records=300)
+    assert 7 not in agg.cell_ids
+    assert len(agg) == len(np.unique(a['cellID']))
+    for i, c in enumerate(agg.cell_ids):
+        p = a[a['cellID'] == c]
+        assert agg.counts[i] == len(p)
+        assert np.allclose(agg.centers[i], p['abs_position'].mean(axis=0))
+        assert agg.areas[i] == p['area'].sum()
+        bc = np.bincount(p['barcode_id'], minlength=140)
+        assert (agg.barcode_counts[i].toarray().ravel() == bc).all()
+    assert np.allclose(agg.barcode_freq().sum(axis=1), 1)
+
+
+def test_cell_aggregate_cache(merfish_file):
+    fname, _ = merfish_file(500)
+    cache = fname + '.cells.npz'
+    agg = cell_aggregate(fname)
+    cached = cell_aggregate(fname)
+    assert (cached.centers == agg.centers).all()
+    assert (cached.barcode_counts != agg.barcode_counts).nnz == 0
+
+    merfish_file(600)
+    assert cell_aggregate(fname).counts.sum() == 600
+    assert cell_aggregate(fname, cache_fname=cache).counts.sum() == 600
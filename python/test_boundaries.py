@@ -0,0 +1,24 @@
+import numpy as np
+from boundaries import cell_boundaries
+from voronoi import polygon_area
+
+
+def test_cell_boundaries():
+    # an L shaped cell (two 4x2 unit rectangles) next to a square cell
+    g = np.mgrid[0:5, 0:3].reshape(2, -1).T.astype(float)
+    upper = np.mgrid[0:3, 3:5].reshape(2, -1).T.astype(float)
+    square = np.mgrid[0:4, 0:4].reshape(2, -1).T + [10.0, 0.0]
+    coord = np.vstack([g, upper, square])
+    rng = np.random.RandomState(0)
+    coord += rng.uniform(-1e-3, 1e-3, size=coord.shape)
+    cells = np.repeat([4, 9], [len(g) + len(upper), len(square)])
+
+    cell_ids, vertices, indptr = cell_boundaries(coord, cells,
+                                                 max_radius=1)
+    assert cell_ids.tolist() == [4, 9]
+    areas = [polygon_area(vertices[indptr[i]:indptr[i+1]])
+             for i in range(2)]
+    # the L plus the half unit square at its inner corner (2, 2)
+    assert np.allclose(areas, [4 * 2 + 2 * 2 + 0.5, 3 * 3], atol=0.05)
+    # whereas the convex hull would bridge (4, 2) -- (2, 4)
+    assert areas[0] < 14 - 1
@@ -0,0 +1,15 @@
+from reader import sort_merfish
+from cells import load_cells
+
+
+def test_load_cells(tmp_path, merfish_file):
+    fname, a = merfish_file(1000, num_cells=30)
+    out = str(tmp_path / "a.v2.bin")
+    sort_merfish(fname, out)
+    ids = ["7", "3", "12", "3"]
+    ref = load_cells(fname, ids, verbose=False, index=False)
+    assert ref['cellID'].tolist() == sorted(c for c in a['cellID']
+                                            if c in (3, 7, 12))
+    for f in [fname, out]:
+        df = load_cells(f, ids, verbose=False)
+        assert df['cellID'].tolist() == ref['cellID'].tolist()
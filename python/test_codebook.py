@@ -0,0 +1,24 @@
+import numpy as np
+from reader import read_codebook
+from codebook import Codebook
+
+
+def test_codebook(codebook_fname):
+    codes = read_codebook(codebook_fname)
+    cb = Codebook.read(codebook_fname)
+    assert len(cb) == len(codes)
+    assert cb.is_blank.sum() == codes['name'].str.startswith('Blank-').sum()
+    assert (cb.decode(codes['barcode'].values) == np.arange(len(cb))).all()
+    assert (cb.lookup >= 0).sum() == len(cb)
+
+    flipped = cb.neighbors[:, 5]
+    assert (cb.decode(flipped) == -1).all()
+    assert (cb.correct(flipped) == np.arange(len(cb))).all()
+    assert (cb.correct(cb.barcodes) == np.arange(len(cb))).all()
+
+
+def test_codebook_ambiguous():
+    cb = Codebook(np.array([0b0000, 0b0011]))
+    assert cb.correct(np.array([0b0001, 0b0010])).tolist() == [-1, -1]
+    assert cb.correct(np.array([0b1000, 0b0111])).tolist() == [0, 1]
+    assert cb.decode(np.array([0b0011, 0b0100])).tolist() == [1, -1]
@@ -0,0 +1,33 @@
+import numpy as np
+from reader import read_codebook
+from errors import estimate
+
+
+def test_estimate(random_records, merfish_file, codebook_fname):
+    a = random_records(3000)
+    codes = read_codebook(codebook_fname)
+    blanks = codes[codes['name'].str.startswith('Blank-')]['barcode'].values
+    a['barcode'][:500] = blanks[np.arange(500) % len(blanks)]
+    fname, _ = merfish_file(a)
+    model = estimate(fname, codebook_fname, chunk_records=700)
+
+    # reference: the former broadcasting implementation
+    error_bits = a['error_bit'].astype(np.uint32)
+    barcodes = a['barcode']
+    correction = (1 << (error_bits - 1)).astype(np.uint64)
+    correction[error_bits == 0] = 0
+    one_to_zero = barcodes & correction
+    zero_to_one = (~barcodes) & correction
+    sel = (1 << np.arange(0, 16)).reshape((-1, 1)).astype(np.uint64)
+    assert (model.one_to_zero == (one_to_zero == sel).sum(axis=1)).all()
+    assert (model.zero_to_one == (zero_to_one == sel).sum(axis=1)).all()
+    uncorrected = barcodes ^ correction
+    blank_col = blanks.reshape((-1, 1)).astype(np.uint64)
+    assert (model.blanks_pre == (uncorrected == blank_col).sum(axis=1)).all()
+    assert (model.blanks_post == (barcodes == blank_col).sum(axis=1)).all()
+
+    assert model.fov[:, 0].sum() == model.cell[:, 0].sum() == len(a)
+    f = a['fov_id'] == 3
+    assert model.fov[3].tolist() == [f.sum(), (one_to_zero[f] > 0).sum(),
+                                     (zero_to_one[f] > 0).sum()]
+    assert np.allclose(model.rates(model.fov)[3], model.fov[3, 1:] / f.sum())
@@ -0,0 +1,29 @@
+import h5py
+from export import write_hdf5, load_hdf5
+
+
+def test_hdf5_roundtrip(tmp_path, merfish_file):
+    fname, a = merfish_file(1000)
+    out = str(tmp_path / "a.h5")
+    write_hdf5(fname, out, chunk_rows=64, chunk_records=200, threads=3)
+    b = load_hdf5(out)
+    assert b.dtype == a.dtype
+    assert (b == a).all()
+    with h5py.File(out, 'r') as io:
+        assert io['abs_position'].chunks == (64, 2)
+        assert io['abs_position'].compression == 'gzip'
+    assert (load_hdf5(out, start=990)['cellID'] == a['cellID'][990:]).all()
+
+
+def test_hdf5_fields(tmp_path, merfish_file):
+    fname, a = merfish_file(100)
+    out = str(tmp_path / "a.h5")
+    fields = ['cellID', 'abs_position']
+    write_hdf5(fname, out, fields=fields, level=0)
+    b = load_hdf5(out)
+    assert b.dtype.names == tuple(fields)
+    for f in fields:
+        assert (b[f] == a[f]).all()
+    with h5py.File(out, 'r') as io:
+        assert set(io) == set(fields)
+        assert io['cellID'].compression is None
@@ -0,0 +1,32 @@
+import numpy as np
+from fov import fov_boxes, fov_overlaps
+
+
+def test_fov_boxes(merfish_file):
+    fname, a = merfish_file(1000)
+    fov_ids, counts, boxes = fov_boxes(fname)
+    assert fov_ids.tolist() == np.unique(a['fov_id']).tolist()
+    for f, c, b in zip(fov_ids, counts, boxes):
+        pos = a['abs_position'][a['fov_id'] == f]
+        assert c == len(pos)
+        assert b.tolist() == [pos[:, 0].min(), pos[:, 0].max(),
+                              pos[:, 1].min(), pos[:, 1].max()]
+
+
+def test_fov_overlaps():
+    rng = np.random.RandomState(1)
+    lo = rng.uniform(0, 100, size=(50, 2))
+    size = rng.uniform(1, 20, size=(50, 2))
+    boxes = np.column_stack([lo[:, 0], lo[:, 0] + size[:, 0],
+                             lo[:, 1], lo[:, 1] + size[:, 1]])
+    pairs, areas = fov_overlaps(boxes)
+    found = {tuple(sorted(p)): a for p, a in zip(pairs.tolist(), areas)}
+    expected = {}
+    for i in range(len(boxes)):
+        for j in range(i + 1, len(boxes)):
+            dx = min(boxes[i, 1], boxes[j, 1]) - max(boxes[i, 0], boxes[j, 0])
+            dy = min(boxes[i, 3], boxes[j, 3]) - max(boxes[i, 2], boxes[j, 2])
+            if dx > 0 and dy > 0:
+                expected[(i, j)] = dx * dy
+    assert found.keys() == expected.keys()
+    assert np.allclose([found[k] for k in expected], list(expected.values()))
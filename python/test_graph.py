@@ -0,0 +1,96 @@
+import numpy as np
+from graph import (delaunay_graph, tiled_delaunay_graph,
+                   euclidean_edge_length, knn_graph, radius_graph,
+                   edges_to_csr, SpatialGraph, store_graph, load_graph)
+
+
+def _edge_set(edges):
+    return set(map(tuple, np.sort(edges, axis=1).tolist()))
+
+
+def test_tiled_delaunay_single_tile():
+    coord = np.random.default_rng(0).uniform(0, 10, (1000, 2))
+    edges = tiled_delaunay_graph(coord, processes=1)
+    assert _edge_set(edges) == _edge_set(delaunay_graph(coord))
+    assert (edges[:, 0] < edges[:, 1]).all()
+
+
+def test_tiled_delaunay():
+    coord = np.random.default_rng(1).uniform(0, 100, (20000, 2))
+    expected = delaunay_graph(coord)
+    for processes in [1, 2]:
+        edges = tiled_delaunay_graph(coord, tile=25, overlap=5,
+                                     processes=processes)
+        assert len(np.unique(edges, axis=0)) == len(edges)
+        # only long edges along the convex hull may differ
+        short = _edge_set(expected[euclidean_edge_length(expected, coord)
+                                   < 5])
+        assert short <= _edge_set(edges)
+        assert len(_edge_set(edges) ^ _edge_set(expected)) < 20
+
+
+def test_knn_graph():
+    coord = np.random.default_rng(2).uniform(0, 10, (500, 2))
+    k = 4
+    edges = knn_graph(coord, k)
+    assert (edges[:, 0] < edges[:, 1]).all()
+    dist = np.sqrt(((coord[:, None] - coord[None])**2).sum(axis=2))
+    np.fill_diagonal(dist, np.inf)
+    nearest = np.argsort(dist, axis=1)[:, :k]
+    expected = _edge_set(np.stack([np.repeat(np.arange(len(coord)), k),
+                                   nearest.ravel()], axis=1))
+    assert _edge_set(edges) == expected
+    indptr, indices = edges_to_csr(edges, len(coord))
+    assert np.diff(indptr).min() >= k
+    assert indices.dtype == np.int32
+
+
+def test_radius_graph():
+    coord = np.random.default_rng(3).uniform(0, 10, (500, 2))
+    r = 0.7
+    edges = radius_graph(coord, r)
+    dist = np.sqrt(((coord[:, None] - coord[None])**2).sum(axis=2))
+    i, j = np.nonzero(np.triu(dist <= r, k=1))
+    assert np.array_equal(edges, np.stack([i, j], axis=1))
+
+
+def test_edges_to_csr():
+    edges = np.array([(0, 2), (1, 2), (2, 3)])
+    indptr, indices = edges_to_csr(edges, 5)
+    assert list(indptr) == [0, 1, 2, 5, 6, 6]
+    assert list(indices) == [2, 2, 0, 1, 3, 2]
+
+
+def test_spatial_graph(tmp_path):
+    coord = np.random.default_rng(4).uniform(0, 10, (300, 2))
+    g = SpatialGraph.delaunay(coord)
+    edges = np.unique(delaunay_graph(coord), axis=0)
+    assert g.num_edges == len(edges)
+    assert np.array_equal(g.edges(), edges)
+    assert g.indices.dtype == np.int32
+    nb = g.neighbors(7)
+    assert nb.base is not None
+    assert (np.diff(nb) > 0).all()
+
+    mat = g.to_sparse()
+    assert (mat != mat.T).nnz == 0
+    assert np.allclose(mat[edges[:, 0], edges[:, 1]].A1,
+                       euclidean_edge_length(edges, coord))
+    h = SpatialGraph.from_sparse(mat, coord)
+    assert np.array_equal(h.indptr, g.indptr)
+    assert np.array_equal(h.indices, g.indices)
+
+    short = g.subgraph(g.lengths < 1)
+    assert np.array_equal(short.edges(),
+                          edges[euclidean_edge_length(edges, coord) < 1])
+
+    fname = str(tmp_path / 'graph.h5')
+    values = np.arange(len(coord), dtype=float)
+    store_graph(fname, g.edges(), values, coord)
+    h, v = load_graph(fname)
+    assert np.array_equal(v, values)
+    assert np.array_equal(h.indptr, g.indptr)
+    assert np.array_equal(h.indices, g.indices)
+    assert np.allclose(h.lengths, g.lengths)
+    g.save(fname)
+    assert np.array_equal(SpatialGraph.load(fname).edges(), g.edges())
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from img import fill_img, rasterize, generate_colortable, downsample, \
+    write_pyramid, rasterize_barcodes, save_images, rasterize_strips
+
+
+def test_rasterize():
+    rng = np.random.RandomState(0)
+    n, width, height = 5000, 150, 70
+    x = rng.randint(0, width, size=n)
+    y = rng.randint(0, height, size=n)
+    cells = rng.randint(0, 1000, size=n).astype(np.uint32)
+    colortab = generate_colortable() * 0.25
+
+    ref = np.zeros((width, height, colortab.shape[1]))
+    fill_img(ref, x, y, colortab[cells % len(colortab)])
+    img = rasterize(x, y, cells, colortab, width, height, band=16)
+    assert img.dtype == np.float32
+    assert np.allclose(img, ref, atol=1e-4)
+
+    w = rng.uniform(size=n).astype(np.float32)
+    img = rasterize(x, y, cells, colortab, width, height, weights=w,
+                    dtype=np.uint16)
+    ref[:] = 0
+    fill_img(ref, x, y, colortab[cells % len(colortab)] * w[:, None])
+    assert img.dtype == np.uint16
+    assert np.abs(img / 65535.0 - np.minimum(ref, 1)).max() < 1e-3
+
+
+def test_rasterize_bounds():
+    cells = np.zeros(2, dtype=np.uint32)
+    for x, y in [([0, 500], [0, 5]), ([0, 5], [0, 10]), ([-1, 0], [0, 0])]:
+        with pytest.raises(ValueError):
+            rasterize(np.array(x), np.array(y), cells,
+                      generate_colortable(), width=10, height=10)
+        with pytest.raises(ValueError):
+            rasterize_barcodes(np.array(x), np.array(y), cells,
+                               width=10, height=10)
+
+
+def test_downsample():
+    img = np.arange(3 * 5, dtype=np.float32).reshape(3, 5, 1)
+    d = downsample(img)
+    assert d.shape == (2, 3, 1)
+    assert d[0, 0, 0] == (0 + 1 + 5 + 6) / 4
+    assert d[1, 2, 0] == 14 / 4
+
+
+def test_write_pyramid(tmp_path):
+    import json
+    import matplotlib.pyplot as plt
+
+    img = np.random.RandomState(0).uniform(size=(70, 45, 4))
+    out = str(tmp_path / "tiles")
+    assert write_pyramid(img, out, tile=16) == 4
+    with open(out + "/pyramid.json") as io:
+        assert json.load(io)['levels'] == 4
+    assert sorted(p.name for p in (tmp_path / "tiles" / "3").iterdir()) == \
+        sorted(f'{r}_{c}.png' for r in range(5) for c in range(3))
+    assert [p.name for p in (tmp_path / "tiles" / "0").iterdir()] == \
+        ['0_0.png']
+    t = plt.imread(out + "/3/4_2.png")
+    assert t.shape == (6, 13, 4)
+    assert np.abs(t - img[64:, 32:]).max() < 1 / 255 + 1e-6
+    t = plt.imread(out + "/2/1_0.png")
+    assert np.abs(t - downsample(img)[16:32, :16]).max() < 1 / 255 + 1e-6
+    assert plt.imread(out + "/0/0_0.png").shape == (9, 6, 4)
+
+
+def test_pyramid_strips(tmp_path):
+    import matplotlib.pyplot as plt
+
+    rng = np.random.RandomState(1)
+    n, width, height = 3000, 70, 45
+    x = rng.randint(0, width, size=n)
+    y = rng.randint(0, height, size=n)
+    cells = rng.randint(0, 100, size=n).astype(np.uint32)
+    colortab = generate_colortable() * 0.1
+    img = rasterize(x, y, cells, colortab, width, height)
+    strips = list(rasterize_strips(x, y, cells, colortab, width, height,
+                                   strip=16))
+    assert [len(s) for s in strips] == [16, 16, 16, 16, 6]
+    assert np.allclose(np.concatenate(strips), img)
+
+    a, b = str(tmp_path / "a"), str(tmp_path / "b")
+    write_pyramid(np.minimum(img, 1), a, tile=16)
+    strips = rasterize_strips(x, y, cells, colortab, width, height, strip=16)
+    assert write_pyramid((np.minimum(s, 1) for s in strips), b, tile=16,
+                         width=width, height=height) == 4
+    for f in ["3/2_1.png", "0/0_0.png"]:
+        assert (plt.imread(f"{a}/{f}") == plt.imread(f"{b}/{f}")).all()
+
+
+def test_rasterize_barcodes(tmp_path):
+    import matplotlib.pyplot as plt
+
+    rng = np.random.RandomState(0)
+    n, width, height = 5000, 40, 30
+    x = rng.randint(0, width, size=n)
+    y = rng.randint(0, height, size=n)
+    bid = rng.randint(0, 140, size=n).astype(np.uint16)
+    barcodes, imgs = rasterize_barcodes(x, y, bid, barcodes=[3, 77],
+                                        width=width, height=height, band=8)
+    assert imgs.shape == (2, width, height)
+    for b, img in zip(barcodes, imgs):
+        ref = np.zeros((width, height), dtype=int)
+        np.add.at(ref, (x[bid == b], y[bid == b]), 1)
+        assert (img == ref).all()
+    barcodes, imgs = rasterize_barcodes(x, y, bid)
+    assert imgs.sum() == n
+
+    fnames = [str(tmp_path / f"barcode_{b:03d}.png") for b in barcodes[:3]]
+    save_images(imgs[:3], fnames, threads=2)
+    assert plt.imread(fnames[0]).shape == (width, height, 4)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from polygon import fill_exclusive, cell_pixels
+
+
+def test_fill_exclusive():
+    rng = np.random.RandomState(0)
+    n, width, height = 3000, 50, 40
+    x = rng.randint(0, width, size=n)
+    y = rng.randint(0, height, size=n)
+    cells = rng.randint(0, 300, size=n).astype(np.uint32)
+    img = np.zeros((width, height), dtype=np.int64)
+    fill_exclusive(img, x, y, cells, full=-2, empty=-1, band=8)
+
+    owners = {}
+    for xi, yi, c in zip(x, y, cells):
+        owners.setdefault((xi, yi), set()).add(c)
+    for (xi, yi), cs in owners.items():
+        assert img[xi, yi] == (cs.pop() if len(cs) == 1 else -2)
+    assert (img == -1).sum() == width * height - len(owners)
+
+    counts = cell_pixels(img, minlength=300)
+    assert counts.sum() == (img >= 0).sum()
+    assert counts[img[img >= 0][0]] >= 1
+
+
+def test_fill_exclusive_bounds():
+    img = np.empty((10, 10), dtype=np.int64)
+    with pytest.raises(ValueError):
+        fill_exclusive(img, np.array([0, 10]), np.array([0, 0]),
+                       np.array([1, 2]))
@@ -0,0 +1,133 @@
+import numpy as np
+from reader import read_header, load_merfish, write_merfish, \
+    sort_merfish, write_columnar, column_offsets, CellSorted, Columns, \
+    RecordDef, COLUMN_ALIGN, iter_chunks, CellIndex, SpatialIndex, query_bbox
+
+
+def test_layout_roundtrip(random_records):
+    a = random_records(3)
+    layout = RecordDef.from_dtype(a.dtype)
+    assert layout.sizeof() == 194
+    assert layout.to_dtype() == a.dtype
+
+
+def test_write_read(tmp_path, random_records):
+    fname = str(tmp_path / "a.bin")
+    a = random_records(100)
+    write_merfish(fname, a, chunk_records=7)
+    h = read_header(fname)
+    assert h.version == 1
+    assert h.num_entries == len(a)
+    assert (load_merfish(fname) == a).all()
+
+
+def test_sort_merfish(tmp_path, random_records, merfish_file):
+    a = random_records(1000, num_cells=30)
+    a['cellID'][a['cellID'] == 3] = 4      # one empty cell
+    fname, _ = merfish_file(a)
+    out = str(tmp_path / "a.v2.bin")
+    sort_merfish(fname, out, chunk_records=100)
+
+    h = read_header(out)
+    assert h.version == 2
+    assert h.num_cells == a['cellID'].max() + 1
+    cells = CellSorted(out)
+    assert len(cells.records) == len(a)
+    assert len(cells[3]) == 0
+    assert len(cells[10**6]) == 0
+    for c in [0, 4, 29]:
+        sel = np.sort(a[a['cellID'] == c], order='barcode_id', kind='stable')
+        assert (np.sort(cells[c], order='barcode_id') == sel).all()
+        assert (np.diff(cells[c]['barcode_id'].astype(int)) >= 0).all()
+    assert len(cells.cells([0, 4])) == len(cells[0]) + len(cells[4])
+
+
+def test_columnar(tmp_path, merfish_file):
+    fname, a = merfish_file(1000)
+    out = str(tmp_path / "a.col.bin")
+    write_columnar(fname, out, chunk_records=333)
+
+    h = read_header(out)
+    assert h.version == 3
+    cols = load_merfish(out)
+    assert isinstance(cols, Columns)
+    assert len(cols) == len(a)
+    assert cols.dtype == a.dtype
+    for d, off in column_offsets(h).items():
+        assert off % COLUMN_ALIGN == 0
+        assert (cols[d] == a[d]).all()
+    sub = cols[['cellID', 'abs_position']]
+    assert (sub['abs_position'] == a['abs_position']).all()
+    mask = a['cellID'] == 3
+    assert (cols[mask] == a[mask]).all()
+    for i in [5, np.int64(-1)]:
+        row = cols[i]
+        assert isinstance(row, np.void)
+        assert row == a[i]
+        assert (row['abs_position'] == a[i]['abs_position']).all()
+
+
+def test_iter_chunks(tmp_path, merfish_file):
+    fname, a = merfish_file(1000)
+    out = str(tmp_path / "a.col.bin")
+    write_columnar(fname, out)
+    fields = ['cellID', 'abs_position']
+    for f in [fname, out]:
+        chunks = list(iter_chunks(f, fields, chunk_records=300))
+        assert [len(c) for c in chunks] == [300, 300, 300, 100]
+        assert chunks[0].dtype.names == tuple(fields)
+        b = np.concatenate(chunks)
+        for d in fields:
+            assert (b[d] == a[d]).all()
+    assert len(next(iter_chunks(fname))) == len(a)
+    chunks = list(iter_chunks(out, fields, chunk_records=300, start=250,
+                              stop=900))
+    assert [len(c) for c in chunks] == [300, 300, 50]
+    assert (np.concatenate(chunks)['cellID'] == a['cellID'][250:900]).all()
+
+
+def test_cell_index(merfish_file):
+    fname, a = merfish_file(1000, num_cells=30)
+    idx = CellIndex(fname)
+    cached = CellIndex(fname)
+    assert isinstance(cached.order, np.memmap)
+    assert (cached.order == idx.order).all()
+    sel = idx.cells([5, 2])
+    assert (sel[:len(idx[5])] == a[a['cellID'] == 5]).all()
+    assert (sel[len(idx[5]):] == a[a['cellID'] == 2]).all()
+    assert len(idx.cells([])) == 0
+    assert len(idx[10**6]) == 0
+
+
+def test_query_bbox(merfish_file):
+    fname, a = merfish_file(2000)
+    x, y = a['abs_position'].T
+    for box in [(10, 80, 200, 290), (-5, 500, -5, 500), (50, 50.5, 0, 1)]:
+        xmin, xmax, ymin, ymax = box
+        ref = a[(xmin <= x) & (x <= xmax) & (ymin <= y) & (y <= ymax)]
+        assert (query_bbox(fname, *box, tile=17.0) == ref).all()
+    idx = SpatialIndex(fname, tile=17.0)
+    assert isinstance(idx.order, np.memmap)
+    assert idx.indptr[-1] == len(a)
+    assert len(idx.positions(10, 80, 200, 290)) < len(a)
+
+
+def test_header_cache(tmp_path, merfish_file):
+    fname, _ = merfish_file(10)
+    out = str(tmp_path / "a.v2.bin")
+    h = read_header(fname)
+    assert read_header(fname).num_entries == h.num_entries == 10
+    merfish_file(20)
+    assert read_header(fname).num_entries == 20
+
+    sort_merfish(fname, out)
+    h = read_header(out)
+    small = read_header(out, read_size=12)
+    assert (small.offset, small.num_cells, small.layout.fields) == \
+        (h.offset, h.num_cells, h.layout.fields)
+
+    # the cached header is not shared with the callers
+    h.layout.fields[0] = 'oops'
+    h.layout.lens.append(3)
+    assert read_header(out).layout.fields[0] == 'barcode'
+    assert read_header(out).layout.to_dtype() == small.layout.to_dtype()
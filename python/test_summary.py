@@ -0,0 +1,44 @@
+import numpy as np
+from reader import write_merfish
+from summary import Histogram, summarize
+
+
+def test_histogram_merge():
+    x = np.array([0.5, 1.5, 1.7, -2.0, 9.9])
+    h = Histogram(-2, 11, 13).add(x[:2])
+    h.merge(Histogram(-2, 11, 13).add(x[2:]))
+    counts, edges = np.histogram(x, bins=np.arange(-2, 12))
+    assert np.allclose(h.edges, edges)
+    assert (h.counts == counts).all()
+    assert h.trim1(0.2).counts.sum() == 4
+
+
+def test_histogram_outliers():
+    h = Histogram(0, 10, 100).add([0.5, 2.0, 3e7, -1, np.nan, np.inf])
+    assert len(h.counts) == 100
+    assert h.counts.sum() == 2
+    assert (h.underflow, h.overflow) == (1, 2)
+    # trimming 30% of the 5 values drops the overflow
+    t = h.trim1(0.3)
+    assert t.counts.sum() == 2 and t.overflow == 0
+    assert t.hi == 2.1
+
+
+def test_summarize(tmp_path, random_records):
+    fnames = [str(tmp_path / f"{i}.bin") for i in range(2)]
+    arrays = [random_records(1000, seed=i) for i in range(2)]
+    for f, a in zip(fnames, arrays):
+        write_merfish(f, a)
+    for processes in [1, 2]:
+        res = summarize(fnames, processes=processes, task_records=300,
+                        chunk_records=70)
+        for f, a in zip(fnames, arrays):
+            s = res[f]
+            assert s.n == len(a)
+            pos = a['abs_position']
+            assert (s.lo['abs_position'] == pos.min(axis=0)).all()
+            assert (s.hi['abs_position'] == pos.max(axis=0)).all()
+            assert np.isclose(s.mean('inNucleus'), a['inNucleus'].mean())
+            assert (s.hists['error_bit'].counts ==
+                    np.bincount(a['error_bit'])).all()
+            assert s.hists['area'].counts.sum() == len(a)
@@ -1,5 +1,5 @@
 import numpy as np
-from utils import is_sorted
+from utils import is_sorted, group_index, unique_elements, GroupBy
 
 
 def test_reshape():
@@ -25,3 +25,48 @@ def test_slow():
         cell_order = np.argsort(a['cellID'])
         assert not is_sorted(cell_order)
         assert is_sorted(a['cellID'][cell_order])
+
+
+def test_groupby():
+    keys = np.array([2, 2, 3, 7, 7, 7], dtype=np.uint32)
+    vals = np.array([1, 2, 3, 4, 5, 60000], dtype=np.uint16)
+    g = GroupBy(keys)
+    assert len(g) == 3
+    assert g.indptr.tolist() == [0, 2, 3, 6]
+    assert g.keys.tolist() == [2, 3, 7]
+    assert g.count().tolist() == [2, 1, 3]
+    assert g.sum(vals).tolist() == [3, 3, 60009]
+    assert g.mean(vals[:, None] * [1, 2])[:, 1].tolist() == [3, 6, 40006]
+    assert g.min(vals).tolist() == [1, 3, 4]
+    assert g.max(vals).tolist() == [2, 3, 60000]
+    assert g.bincount2d(np.array([0, 0, 1, 2, 0, 2])).tolist() == \
+        [[2, 0, 0], [0, 1, 0], [1, 0, 2]]
+    assert [len(s) for s in g.split(vals)] == [2, 1, 3]
+
+
+def test_groupby_empty():
+    g = GroupBy(np.zeros(0, dtype=int))
+    assert len(g) == 0
+    assert g.sum(np.zeros(0)).shape == (0,)
+
+
+def test_group_index():
+    a = np.array([0, 0, 3, 3, 3, 9], dtype=np.uint16)
+    assert group_index(a).tolist() == [0, 2, 5]
+    assert unique_elements(a).tolist() == [0, 3, 9]
+    assert unique_elements(a).dtype == a.dtype
+    assert len(group_index(a[:0])) == 0
+
+
+def test_is_sorted_nan():
+    assert not is_sorted(np.array([1.0, np.nan, 0.0]))
+    assert not is_sorted(np.array([0.0, np.nan]))
+    assert is_sorted(np.array([0.0, 1.0, np.inf]))
+
+
+def test_is_sorted_strided():
+    a = np.zeros(4, dtype=[('x', np.float32), ('cellID', np.uint32)])
+    a['cellID'] = [1, 2, 2, 5]
+    assert is_sorted(a['cellID'])
+    a['cellID'][-1] = 0
+    assert not is_sorted(a['cellID'])
@@ -0,0 +1,46 @@
+import numpy as np
+from variability import (spatial_variability, stabilize, qvalues,
+                         kernel_spectrum, se_kernel)
+
+
+def _instance(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    coord = rng.uniform(0, 10, (n, 2))
+    pattern = np.sin(coord[:, 0]) + np.cos(coord[:, 1])
+    Y = np.column_stack([pattern + 0.5 * rng.normal(size=n),
+                         rng.normal(size=n),
+                         rng.normal(size=n)])
+    return coord, Y
+
+
+def test_spectrum_exact():
+    coord, Y = _instance(n=50)
+    s, C = kernel_spectrum(coord, Y, 2.0, np.arange(50), block=7)
+    lam, U = np.linalg.eigh(se_kernel(coord, coord, 2.0))
+    keep = lam > 1e-10 * lam.max()
+    assert np.allclose(np.sort(s), np.sort(lam[keep])[-len(s):])
+    assert np.allclose((C**2).sum(axis=0), ((U[:, keep].T @ Y)**2).sum(0))
+
+
+def test_spatial_variability():
+    coord, Y = _instance()
+    for num_inducing in [1000, 100]:
+        res = spatial_variability(coord, Y, names=['sin', 'a', 'b'],
+                                  num_inducing=num_inducing)
+        assert list(res['g']) == ['sin', 'a', 'b']
+        assert res['pval'][0] < 1e-10
+        assert (res['pval'][1:] > 1e-3).all()
+        assert res['FSV'][0] > 0.5
+        assert 0.5 < res['l'][0] < 5
+
+
+def test_stabilize():
+    counts = np.array([[0, 4], [1, 9], [4, 16], [9, 0]])
+    y = stabilize(counts)
+    assert y.shape == counts.shape
+    assert np.allclose(y.sum(axis=0), 0)
+
+
+def test_qvalues():
+    q = qvalues(np.array([0.01, 0.04, 0.03, 0.5]))
+    assert np.allclose(q, [0.04, 0.16 / 3, 0.16 / 3, 0.5])
@@ -0,0 +1,73 @@
+import numpy as np
+from scipy import spatial
+from voronoi import (polygon_area, polygon_areas, polygon_centroids,
+                     polygon_perimeters, voronoi_polygons, clip_polygons,
+                     VoronoiCells)
+
+
+def _ragged(polys):
+    indptr = np.cumsum([0] + [len(p) for p in polys])
+    return np.concatenate(polys).astype(float), indptr
+
+
+def test_polygon_kernels():
+    square = np.array([(0, 0), (2, 0), (2, 2), (0, 2)])
+    triangle = np.array([(2, 1), (4, 5), (7, 8)])
+    point = np.array([(3, 3)])
+    vertices, indptr = _ragged([square, triangle, point, square[::-1] + 1])
+    assert np.allclose(polygon_areas(vertices, indptr), [4, 3, 0, 4])
+    assert np.allclose(polygon_perimeters(vertices, indptr),
+                       [8, polygon_perimeters(triangle, [0, 3])[0], 0, 8])
+    assert np.allclose(polygon_centroids(vertices, indptr),
+                       [(1, 1), (13/3, 14/3), (3, 3), (2, 2)])
+
+
+def test_polygon_kernels_empty():
+    vertices, indptr = _ragged([np.zeros((0, 2)), np.eye(2)[[0, 1, 1]]])
+    indptr = np.array([0, 0, 0, 3])
+    assert np.allclose(polygon_areas(vertices, indptr), 0)
+    assert np.isnan(polygon_centroids(vertices, indptr)[0]).all()
+
+
+def test_voronoi_polygons():
+    x, y = np.mgrid[0:5, 0:5]
+    points = np.column_stack([x.ravel(), y.ravel()]) + \
+        np.random.default_rng(0).uniform(-0.1, 0.1, (25, 2))
+    vor = spatial.Voronoi(points)
+    vertices, indptr = voronoi_polygons(vor)
+    assert len(indptr) == len(points) + 1
+    areas = polygon_areas(vertices, indptr)
+    for i, r in enumerate(vor.point_region):
+        region = vor.regions[r]
+        if -1 in region or not region:
+            assert areas[i] == 0
+        else:
+            assert np.isclose(areas[i], polygon_area(vor.vertices[region]))
+    # the inner 3 x 3 points have bounded cells of area about 1
+    inner = (x.ravel() % 4 > 0) & (y.ravel() % 4 > 0)
+    assert np.allclose(areas[inner], 1, atol=0.3)
+
+
+def test_clip_polygons():
+    square = np.array([(0, 0), (2, 0), (2, 2), (0, 2)], dtype=float)
+    vertices, indptr = _ragged([square, square + 3])
+    # keep x <= 1
+    vertices, indptr = clip_polygons(vertices, indptr, np.array([1, 0]), -1)
+    assert np.allclose(polygon_areas(vertices, indptr), [2, 0])
+    assert list(indptr) == [0, 4, 4]
+
+
+def test_voronoi_cells():
+    points = np.random.default_rng(1).uniform(0, 10, (500, 2))
+    box = VoronoiCells(points, margin=0.5)
+    lo, hi = points.min(axis=0) - 0.5, points.max(axis=0) + 0.5
+    assert (box.areas > 0).all()
+    assert np.isclose(box.areas.sum(), np.prod(hi - lo))
+    assert (box.vertices >= lo - 1e-9).all()
+    assert (box.vertices <= hi + 1e-9).all()
+    assert box.neighbors.min() >= 2
+    assert 5.5 < box.neighbors.mean() < 6
+
+    hull = VoronoiCells(points, clip='hull')
+    assert np.isclose(hull.areas.sum(), spatial.ConvexHull(points).volume)
+    assert (hull.areas <= box.areas + 1e-9).all()
@@ -1,25 +1,141 @@
 import sys
 import numpy as np
-from typing import List
+from numba import njit
+
+
+@njit(cache=True)
+def _is_sorted(arr) -> bool:
+    for i in range(1, len(arr)):
+        # like `np.diff(arr) >= 0`: NaNs are never in order
+        if not (arr[i] >= arr[i-1]):
+            return False
+    return True
+
+
+@njit(cache=True)
+def _group_index(arr):
+    n = 1 if len(arr) > 0 else 0
+    for i in range(1, len(arr)):
+        if arr[i] != arr[i-1]:
+            n += 1
+    idx = np.empty(n, dtype=np.int64)
+    if n > 0:
+        idx[0] = 0
+    k = 1
+    for i in range(1, len(arr)):
+        if arr[i] != arr[i-1]:
+            idx[k] = i
+            k += 1
+    return idx
+
+
+@njit(cache=True)
+def _unique_elements(arr):
+    n = 1 if len(arr) > 0 else 0
+    for i in range(1, len(arr)):
+        if arr[i] != arr[i-1]:
+            n += 1
+    uniq = np.empty(n, dtype=arr.dtype)
+    if n > 0:
+        uniq[0] = arr[0]
+    k = 1
+    for i in range(1, len(arr)):
+        if arr[i] != arr[i-1]:
+            uniq[k] = arr[i]
+            k += 1
+    return uniq
 
 
 def is_sorted(arr) -> bool:
-    """Check whether an array is sorted"""
-    if arr.dtype.kind == 'u':
-        return all(np.diff(arr.astype(int)) >= 0)
-    return all(np.diff(arr) >= 0)
+    """Check whether an array is sorted (stops at the first descent)"""
+    return _is_sorted(np.asarray(arr))
 
 
-def group_index(arr) -> List:
-    """Assumption: idx is sorted!"""
-    diff = np.diff(arr.astype(int) if arr.dtype.kind == 'u' else arr)
-    idx, = np.where(diff > 0)
-    return [0] + (idx + 1).tolist()
+def group_index(arr) -> np.ndarray:
+    """Start positions of the groups of equal elements; `arr` is sorted!"""
+    return _group_index(np.asarray(arr))
 
 
-def unique_elements(arr) -> List:
+def unique_elements(arr) -> np.ndarray:
     """Assumes that arr is sorted"""
-    return arr[group_index(arr)]
+    return _unique_elements(np.asarray(arr))
+
+
+def grow(a: np.ndarray, n: int) -> np.ndarray:
+    """Extend `a` by zeros to (at least) `n` rows"""
+    if len(a) >= n:
+        return a
+    return np.concatenate([a, np.zeros((n - len(a),) + a.shape[1:], a.dtype)])
+
+
+class GroupBy:
+    """
+    Groups of equal elements in a sorted `keys` array:
+    group `i` consists of the positions `indptr[i]:indptr[i+1]`
+    and has the key `keys[i]`.
+    The reductions are computed for all groups at once, e.g.
+
+    >>> g = GroupBy(np.array([1, 1, 4, 4, 4]))
+    >>> g.keys
+    array([1, 4])
+    >>> g.sum(np.array([1, 2, 3, 4, 5]))
+    array([ 3, 12])
+    """
+
+    def __init__(self, keys: np.ndarray):
+        keys = np.asarray(keys)
+        assert is_sorted(keys)
+        self.indptr = np.append(group_index(keys), len(keys))
+        self.keys = keys[self.indptr[:-1]]
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def split(self, values: np.ndarray):
+        """Iterate over the groups of `values` (views, no copies)"""
+        for i in range(len(self)):
+            yield values[self.indptr[i]:self.indptr[i+1]]
+
+    def count(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def group_ids(self) -> np.ndarray:
+        """Group number of every element"""
+        return np.repeat(np.arange(len(self)), self.count())
+
+    def reduce(self, ufunc: np.ufunc, values: np.ndarray, dtype=None):
+        """Apply `ufunc.reduceat` on every group (along the first axis)"""
+        values = np.asarray(values)
+        if len(self) == 0:
+            return np.zeros((0,) + values.shape[1:], dtype=dtype or
+                            values.dtype)
+        return ufunc.reduceat(values, self.indptr[:-1], axis=0, dtype=dtype)
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """Sums (integers accumulated as 64 bit to avoid overflows)"""
+        kind = np.asarray(values).dtype.kind
+        dtype = {'u': np.uint64, 'i': np.int64, 'b': np.int64}.get(kind)
+        return self.reduce(np.add, values, dtype=dtype)
+
+    def mean(self, values: np.ndarray) -> np.ndarray:
+        s = self.reduce(np.add, values, dtype=np.float64)
+        return s / self.count().reshape((-1,) + (1,) * (s.ndim - 1))
+
+    def min(self, values: np.ndarray) -> np.ndarray:
+        return self.reduce(np.minimum, values)
+
+    def max(self, values: np.ndarray) -> np.ndarray:
+        return self.reduce(np.maximum, values)
+
+    def bincount2d(self, values: np.ndarray, minlength: int = 0) -> \
+            np.ndarray:
+        """
+        Occurrences of every (non-negative int) value per group,
+        i.e. a matrix of shape `(len(self), max(values.max()+1, minlength))`
+        """
+        m = max(int(values.max()) + 1 if len(values) else 0, minlength)
+        key = self.group_ids() * m + values
+        return np.bincount(key, minlength=len(self) * m).reshape(-1, m)
 
 
 class Status:
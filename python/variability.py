@@ -0,0 +1,187 @@
+"""
+Spatially variable genes (SpatialDE-style) over the cell centers:
+every gene is tested at once against a Gaussian process with squared
+exponential kernel, using one (Nyström) eigendecomposition per length
+scale for all genes.
+"""
+import numpy as np
+import pandas as pd
+from scipy import linalg, stats
+
+
+def se_kernel(a: np.ndarray, b: np.ndarray, lengthscale: float) -> \
+        np.ndarray:
+    """Squared exponential kernel matrix between the points `a` and `b`"""
+    d2 = (a**2).sum(axis=1)[:, np.newaxis] + (b**2).sum(axis=1) - \
+        2 * a @ b.T
+    K = np.exp(-np.maximum(d2, 0) / (2 * lengthscale**2))
+    # negligible entries as exact zeros (denormals slow down BLAS)
+    K[K < 1e-30] = 0
+    return K
+
+
+def stabilize(counts: np.ndarray, totals: np.ndarray = None) -> np.ndarray:
+    """
+    Anscombe transform of the `counts` (cells x genes) with the
+    log total counts per cell regressed out (as in SpatialDE)
+    """
+    counts = np.asarray(counts, dtype=np.float64)
+    if totals is None:
+        totals = counts.sum(axis=1)
+    y = 2 * np.sqrt(counts + 3 / 8)
+    X = np.column_stack([np.ones(len(y)), np.log(np.maximum(totals, 1))])
+    beta, *_ = linalg.lstsq(X, y)
+    return y - X @ beta
+
+
+def qvalues(pvals: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values"""
+    pvals = np.asarray(pvals)
+    n = len(pvals)
+    order = np.argsort(pvals)
+    q = pvals[order] * n / np.arange(1, n + 1)
+    q = np.minimum.accumulate(q[::-1])[::-1]
+    out = np.empty(n)
+    out[order] = np.minimum(q, 1)
+    return out
+
+
+def kernel_spectrum(coord: np.ndarray, Y: np.ndarray, lengthscale: float,
+                    inducing: np.ndarray, block: int = 4096):
+    """
+    Nyström approximation `K ≈ U diag(s) U^T` of the kernel matrix over
+    `coord` from the `inducing` points (indices), computed blockwise
+    without forming any `n x n` or `n x m` matrix.
+
+    Result: eigenvalues `s` and the projections `U^T Y` of the columns of
+    `Y`
+    """
+    Z = coord[inducing]
+    lam, Q = linalg.eigh(se_kernel(Z, Z, lengthscale))
+    keep = lam > 1e-10 * lam.max()
+    W = Q[:, keep] / np.sqrt(lam[keep])
+    # B = K_nm W is never formed: B^T B = W^T (K_mn K_nm) W etc.
+    KtK = np.zeros((len(Z), len(Z)))
+    KtY = np.zeros((len(Z), Y.shape[1]))
+    for i in range(0, len(coord), block):
+        K = se_kernel(coord[i:i + block], Z, lengthscale)
+        KtK += K.T @ K
+        KtY += K.T @ Y[i:i + block]
+    BtB = W.T @ KtK @ W
+    BtY = W.T @ KtY
+    s, V = linalg.eigh(BtB)
+    keep = s > 1e-10 * s.max()
+    s, V = s[keep], V[:, keep]
+    return s, (V.T @ BtY) / np.sqrt(s)[:, np.newaxis]
+
+
+def _loglik(s: np.ndarray, C: np.ndarray, yy: np.ndarray, n: int,
+            deltas: np.ndarray):
+    """
+    Maximal log likelihood (over `deltas`) of `y ~ N(0, σ² (K + δ I))`
+    for all genes, `σ²` profiled out; `K` has the (non-zero) eigenvalues
+    `s`, `C = U^T Y` and `yy` are the squared norms of the columns of `Y`.
+    """
+    C2 = C**2
+    rest = np.maximum(yy - C2.sum(axis=0), 0)
+    quad = (1 / (s + deltas[:, np.newaxis])) @ C2 + \
+        rest / deltas[:, np.newaxis]
+    logdet = np.log(s + deltas[:, np.newaxis]).sum(axis=1) + \
+        (n - len(s)) * np.log(deltas)
+    ll = -0.5 * n * (np.log(2 * np.pi * quad / n) + 1) - \
+        0.5 * logdet[:, np.newaxis]
+    best = ll.argmax(axis=0)
+    genes = np.arange(ll.shape[1])
+    return ll[best, genes], deltas[best]
+
+
+def default_lengthscales(coord: np.ndarray, num: int = 10) -> np.ndarray:
+    """Log spaced from the median nearest neighbour distance to the extent"""
+    from scipy.spatial import cKDTree
+
+    d, _ = cKDTree(coord).query(coord, k=2, workers=-1)
+    lo = max(np.median(d[:, 1]), np.finfo(float).eps)
+    hi = max((coord.max(axis=0) - coord.min(axis=0)).max(), lo)
+    return np.geomspace(lo, hi, num)
+
+
+def spatial_variability(coord: np.ndarray, Y: np.ndarray,
+                        names: np.ndarray = None,
+                        lengthscales: np.ndarray = None,
+                        num_inducing: int = 500,
+                        deltas: np.ndarray = np.logspace(-3, 5, 41),
+                        seed: int = 0) -> pd.DataFrame:
+    """
+    Test all genes (columns of `Y`, e.g. `stabilize`d counts) for spatial
+    variability over the cell centers `coord`: the log likelihood ratio of
+    the best Gaussian process (over `lengthscales` and noise ratios
+    `deltas`) against pure noise, with chi^2 (df 1) p-values.
+    For more than `num_inducing` cells, the kernel is approximated from
+    that many randomly chosen cells (Nyström).
+
+    Result: table with one row per gene (`g`, lengthscale `l`, `LLR`,
+    fraction of spatial variance `FSV`, `pval`, `qval`)
+    """
+    coord = np.asarray(coord, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    n, num_genes = Y.shape
+    assert len(coord) == n
+    Y = Y - Y.mean(axis=0)
+    yy = (Y**2).sum(axis=0)
+    if lengthscales is None:
+        lengthscales = default_lengthscales(coord)
+    if n <= num_inducing:
+        inducing = np.arange(n)
+    else:
+        rng = np.random.default_rng(seed)
+        inducing = np.sort(rng.choice(n, num_inducing, replace=False))
+
+    null = -0.5 * n * (np.log(2 * np.pi * np.maximum(yy, 1e-300) / n) + 1)
+    best = np.full(num_genes, -np.inf)
+    best_l = np.zeros(num_genes)
+    best_delta = np.zeros(num_genes)
+    for lengthscale in lengthscales:
+        s, C = kernel_spectrum(coord, Y, lengthscale, inducing)
+        ll, delta = _loglik(s, C, yy, n, deltas)
+        better = ll > best
+        best[better] = ll[better]
+        best_l[better] = lengthscale
+        best_delta[better] = delta[better]
+
+    llr = np.maximum(2 * (best - null), 0)
+    pvals = stats.chi2.sf(llr, df=1)
+    return pd.DataFrame({
+        'g': names if names is not None else np.arange(num_genes),
+        'l': best_l,
+        'LLR': llr,
+        'FSV': 1 / (1 + best_delta),
+        'pval': pvals,
+        'qval': qvalues(pvals),
+    })
+
+
+if __name__ == '__main__':
+    import argparse
+    from aggregate import cell_aggregate
+    from codebook import Codebook
+    from data import _test_file_name
+
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument('fname', nargs='?', type=str, default=_test_file_name())
+    p.add_argument('-c', '--codebook', type=str, default=None)
+    p.add_argument('-m', '--num-inducing', type=int, default=500)
+    p.add_argument('-o', '--out', type=str, default=None,
+                   help='Write the result table (csv)')
+    args = p.parse_args()
+
+    agg = cell_aggregate(args.fname)
+    counts = agg.barcode_counts.toarray()
+    names = None
+    if args.codebook:
+        names = Codebook.read(args.codebook).names[:counts.shape[1]]
+    res = spatial_variability(agg.centers, stabilize(counts), names=names,
+                              num_inducing=args.num_inducing)
+    res = res.sort_values('LLR', ascending=False)
+    print(res.head(20).to_string(index=False))
+    if args.out:
+        res.to_csv(args.out, index=False)
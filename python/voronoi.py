@@ -4,8 +4,9 @@ Visualize the cell centers by their Voronoi diagram.
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from itertools import chain
 from matplotlib.patches import Polygon
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import PolyCollection
 from scipy import spatial
 from typing import Union
 
@@ -54,23 +55,175 @@ def test_polygon_area_more_complex():
     assert polygon_area(Polygon(points)) == 30
 
 
-def plot_voronoi(points, colors, ax=None, cmap=None, c=15):
-    vor = spatial.Voronoi(points)
-    assert len(vor.point_region) == len(points)
-    assert vor.point_region.min() >= 1
-    assert vor.point_region.max() <= len(points)
+def segment_sum(values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """
+    Sum of `values[indptr[i]:indptr[i+1]]` (along the first axis) for
+    every segment `i`; empty segments sum up to zero
+    """
+    indptr = np.asarray(indptr)
+    lens = np.diff(indptr)
+    out = np.zeros((len(lens),) + values.shape[1:], dtype=values.dtype)
+    nonempty = lens > 0
+    if nonempty.any():
+        out[nonempty] = np.add.reduceat(values, indptr[:-1][nonempty],
+                                        axis=0)
+    return out
+
+
+def next_vertex(indptr: np.ndarray) -> np.ndarray:
+    """Index of the successor of every vertex in its (closed) polygon"""
+    indptr = np.asarray(indptr)
+    nxt = np.arange(1, indptr[-1] + 1)
+    lens = np.diff(indptr)
+    nxt[indptr[1:][lens > 0] - 1] = indptr[:-1][lens > 0]
+    return nxt
+
+
+def _shoelace(vertices: np.ndarray, indptr: np.ndarray):
+    p = np.asarray(vertices, dtype=np.float64)
+    q = p[next_vertex(indptr)]
+    return p, q, p[:, 0] * q[:, 1] - q[:, 0] * p[:, 1]
+
+
+def polygon_areas(vertices: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+    """
+    Areas of all polygons `vertices[indptr[i]:indptr[i+1]]`
+    (ragged array: flat vertices plus offsets), cf. `polygon_area`
+    """
+    _, _, cross = _shoelace(vertices, indptr)
+    return 0.5 * np.abs(segment_sum(cross, indptr))
+
+
+def polygon_centroids(vertices: np.ndarray, indptr: np.ndarray) -> \
+        np.ndarray:
+    """
+    Centroids of all polygons (ragged array, see `polygon_areas`).
+    Degenerate polygons without area get the mean of their vertices
+    (NaN if they have none).
+    """
+    p, q, cross = _shoelace(vertices, indptr)
+    area = 0.5 * segment_sum(cross, indptr)
+    moment = segment_sum((p + q) * cross[:, np.newaxis], indptr)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids = moment / (6 * area[:, np.newaxis])
+        mean = segment_sum(p, indptr) / np.diff(indptr)[:, np.newaxis]
+    degenerate = area == 0
+    centroids[degenerate] = mean[degenerate]
+    return centroids
+
+
+def polygon_perimeters(vertices: np.ndarray, indptr: np.ndarray) -> \
+        np.ndarray:
+    """Perimeters of all (closed) polygons, see `polygon_areas`"""
+    p, q, _ = _shoelace(vertices, indptr)
+    return segment_sum(np.sqrt(((q - p)**2).sum(axis=1)), indptr)
+
+
+def voronoi_polygons(vor: spatial.Voronoi):
+    """
+    Voronoi regions of all input points `vor.points` (in that order)
+    as ragged array `(vertices, indptr)`.
+    Unbounded regions are empty polygons.
+    """
+    regions = vor.regions
+    lens = np.fromiter(map(len, regions), dtype=np.int64, count=len(regions))
+    flat = np.fromiter(chain.from_iterable(regions), dtype=np.int64,
+                       count=lens.sum())
+    start = np.zeros(len(regions) + 1, dtype=np.int64)
+    np.cumsum(lens, out=start[1:])
+    unbounded = segment_sum((flat < 0).astype(np.int64), start) > 0
+    lens[unbounded] = 0
+
+    region = vor.point_region
+    indptr = np.zeros(len(region) + 1, dtype=np.int64)
+    np.cumsum(lens[region], out=indptr[1:])
+    idx = np.repeat(start[region] - indptr[:-1], lens[region]) + \
+        np.arange(indptr[-1])
+    return vor.vertices[flat[idx]], indptr
+
+
+def clip_polygons(vertices: np.ndarray, indptr: np.ndarray,
+                  normal: np.ndarray, offset: float):
+    """
+    Clip all polygons (ragged array) to the half-plane
+    `normal @ x + offset <= 0` (Sutherland-Hodgman, one step).
+
+    Result: the clipped polygons as ragged array `(vertices, indptr)`
+    """
+    p = np.asarray(vertices, dtype=np.float64)
+    nxt = next_vertex(indptr)
+    d = p @ normal + offset
+    inside = d <= 0
+    crossing = inside != inside[nxt]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = d / (d - d[nxt])
+    counts = inside.astype(np.int64) + crossing
+    pos = np.cumsum(counts) - counts
+    out = np.empty((pos[-1] + counts[-1] if len(p) else 0, 2))
+    out[pos[inside]] = p[inside]
+    c = crossing
+    out[pos[c] + inside[c]] = p[c] + t[c, np.newaxis] * (p[nxt[c]] - p[c])
+    new_indptr = np.zeros_like(np.asarray(indptr))
+    np.cumsum(segment_sum(counts, indptr), out=new_indptr[1:])
+    return out, new_indptr
+
 
-    polys = list()
-    for i in vor.point_region:
-        simplex = vor.regions[i]
-        simplex = np.asarray(simplex)
-        if np.any(simplex < 0) or len(simplex) <= 0:
-            polys.append(Polygon(vor.vertices[[i]]))
+class VoronoiCells:
+    """
+    Voronoi regions of all `points`, clipped to the data bounding box
+    (`clip='box'`, enlarged by `margin` on every side) or the convex hull
+    (`clip='hull'`), with
+
+    - `vertices`, `indptr`: the regions as ragged array
+      (region `i` is `vertices[indptr[i]:indptr[i+1]]`)
+    - `areas`: the (bounded) area of every region
+    - `neighbors`: number of Voronoi neighbours of every point
+
+    Four far away sentinel points make every region of `points` bounded;
+    then all regions are clipped at once, one half-plane after another.
+    """
+
+    def __init__(self, points: np.ndarray, clip: str = 'box',
+                 margin: float = 0.0):
+        assert clip in ('box', 'hull'), clip
+        points = np.asarray(points, dtype=np.float64)
+        n = len(points)
+        lo, hi = points.min(axis=0), points.max(axis=0)
+        far = 10 * (hi - lo).max() + 1
+        center = 0.5 * (lo + hi)
+        sentinels = center + far * np.array([(-1, -1), (1, -1),
+                                             (1, 1), (-1, 1)])
+        vor = spatial.Voronoi(np.concatenate([points, sentinels]))
+        vertices, indptr = voronoi_polygons(vor)
+        vertices, indptr = vertices[:indptr[n]], indptr[:n + 1]
+        if clip == 'box':
+            planes = np.array([(-1, 0, lo[0]), (1, 0, -hi[0]),
+                               (0, -1, lo[1]), (0, 1, -hi[1])])
         else:
-            polys.append(Polygon(vor.vertices[simplex]))
+            planes = spatial.ConvexHull(points).equations
+        for eq in planes:
+            vertices, indptr = clip_polygons(vertices, indptr, eq[:2],
+                                             eq[2] - margin)
+        self.vertices, self.indptr = vertices, indptr
+        ridges = vor.ridge_points[(vor.ridge_points < n).all(axis=1)]
+        self.neighbors = np.bincount(ridges.ravel(), minlength=n)
+        self.areas = polygon_areas(self.vertices, self.indptr)
+
+    def __len__(self) -> int:
+        return len(self.areas)
+
+    def polygons(self):
+        """The regions as list of vertex arrays"""
+        return np.split(self.vertices, self.indptr[1:-1])
+
+
+def plot_voronoi(points, colors, ax=None, cmap=None, c=15,
+                 cells: VoronoiCells = None):
+    if cells is None:
+        cells = VoronoiCells(points)
+    assert len(cells) == len(points)
 
-    areas = np.fromiter(map(polygon_area, polys), dtype=float)
-    alpha = 1/np.clip(areas, 3, np.inf)
+    alpha = 1/np.clip(cells.areas, 3, np.inf)
     alpha = alpha.clip(0, alpha.mean() + 1.5*alpha.std())
 
     xmin, ymin = points.min(axis=0)
@@ -82,7 +235,7 @@ def plot_voronoi(points, colors, ax=None, cmap=None, c=15):
     col = cmap(colors)
     col[:, -1] = (c * alpha / alpha.max()).clip(0, 1)
 
-    patch = PatchCollection(polys)
+    patch = PolyCollection(cells.polygons())
     patch.set_facecolor(col)
 
     if ax is None:
@@ -131,6 +284,8 @@ if __name__ == '__main__':
     p.add_argument('-l', '--logarithmic', action='store_true')
     p.add_argument('-c', '--cmap', type=str, default=None)
     p.add_argument('-q', '--quantile', type=float, default=0.99)
+    p.add_argument('-H', '--hull', action='store_true',
+                   help='Clip the Voronoi regions to the convex hull')
     args = p.parse_args()
 
     eps = args.eps
@@ -149,7 +304,8 @@ if __name__ == '__main__':
     plot_clouds(points, colors)
     plt.colorbar()
     plt.figure()
-    plot_voronoi(points, colors, c=15)
+    cells = VoronoiCells(points, clip='hull' if args.hull else 'box')
+    plot_voronoi(points, colors, c=15, cells=cells)
     plot_scatter(points, colors, s=3, alpha=0.9)
     plt.colorbar()
     plt.show()